@@ -0,0 +1,149 @@
+"""
+Benchmark of the gaze smoothing filters. Replays recorded gaze traces
+through each of the filters and reports the time spent per sample,
+the jitter of the cursor, that is the median distance between two
+consecutive positions, and the latency, that is the delay of the cursor
+after the raw samples that fits them best. If no traces are given,
+a synthetic one is generated, with fixations, saccades and noise, and
+replayed once more with timestamps shared by batches of samples, as they
+are when read from a tracker in a single go.
+
+Traces are either recorded by the tracker server, see
+:mod:`pisak.gaze_trace`, or text files with one sample per line,
+in a format: 'timestamp x y', where timestamp is in seconds and x, y
+are fractions of the screen width and height, as sent by the trackers.
+
+Usage: python3 benchmarks/gaze_smoothing.py [trace file ...]
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pisak import smoothing, gaze_trace
+
+
+SCREEN_SIZE = (1920, 1080)
+
+SAMPLE_RATE = 120
+
+MAX_LAG = 0.2
+
+
+def load_trace(path):
+    """
+    Load a recorded gaze trace.
+
+    :param path: path to the trace file.
+
+    :return: list of (timestamp, x, y) samples, coordinates in pixels.
+    """
+    return [(timestamp, x * SCREEN_SIZE[0], y * SCREEN_SIZE[1])
+            for timestamp, x, y in gaze_trace.read_trace(path)]
+
+
+def generate_trace(duration=30, noise=15, seed=0):
+    """
+    Generate a synthetic gaze trace, fixations at random points
+    linked by fast saccades, with gaussian noise and occasional outliers.
+
+    :param duration: duration of the trace, in seconds.
+    :param noise: standard deviation of the noise, in pixels.
+    :param seed: seed of the random numbers generator.
+
+    :return: list of (timestamp, x, y) samples, coordinates in pixels.
+    """
+    rand = random.Random(seed)
+    samples = []
+    x, y = SCREEN_SIZE[0] / 2, SCREEN_SIZE[1] / 2
+    timestamp = 0.0
+    while timestamp < duration:
+        target = (rand.uniform(0, SCREEN_SIZE[0]),
+                  rand.uniform(0, SCREEN_SIZE[1]))
+        saccade = int(0.04 * SAMPLE_RATE)
+        fixation = int(rand.uniform(0.2, 0.8) * SAMPLE_RATE)
+        path = [(x + (target[0] - x) * step / saccade,
+                 y + (target[1] - y) * step / saccade)
+                for step in range(1, saccade + 1)] + [target] * fixation
+        for point_x, point_y in path:
+            spread = noise * (6 if rand.random() < 0.01 else 1)
+            samples.append((timestamp, point_x + rand.gauss(0, spread),
+                            point_y + rand.gauss(0, spread)))
+            timestamp += 1 / SAMPLE_RATE
+        x, y = target
+    return samples
+
+
+def duplicate_timestamps(samples, batch=4):
+    """
+    Make the samples share timestamps in batches, as if they were all read
+    from a tracker in a single go.
+
+    :param samples: list of (timestamp, x, y) samples.
+    :param batch: number of the samples sharing a timestamp.
+
+    :return: list of (timestamp, x, y) samples.
+    """
+    stamped = []
+    for start in range(0, len(samples), batch):
+        chunk = samples[start:start + batch]
+        stamped.extend((chunk[-1][0], x, y) for _timestamp, x, y in chunk)
+    return stamped
+
+
+def measure_jitter(points):
+    """
+    Median distance between consecutive positions, in pixels.
+    """
+    steps = sorted(((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5 for
+                   (x0, y0), (x1, y1) in zip(points, points[1:]))
+    return steps[len(steps) // 2]
+
+
+def measure_latency(samples, points):
+    """
+    Delay of the filtered positions after the raw samples that minimizes
+    the mean squared difference between them, in seconds.
+    """
+    interval = (samples[-1][0] - samples[0][0]) / (len(samples) - 1)
+    best_lag, best_error = 0, None
+    for lag in range(0, int(MAX_LAG / interval) + 1):
+        pairs = zip(samples[:len(samples) - lag], points[lag:])
+        error = sum((x - px) ** 2 + (y - py) ** 2 for
+                    (_t, x, y), (px, py) in pairs) / (len(samples) - lag)
+        if best_error is None or error < best_error:
+            best_lag, best_error = lag, error
+    return best_lag * interval
+
+
+def run(label, samples):
+    """
+    Run all the filters on the given trace and print the results.
+
+    :param label: label of the trace.
+    :param samples: list of (timestamp, x, y) samples.
+    """
+    print("{}, {} samples:".format(label, len(samples)))
+    for name in sorted(smoothing.FILTERS):
+        gaze_filter = smoothing.create_filter(name)
+        start = time.perf_counter()
+        points = [gaze_filter.filter(x, y, timestamp)
+                  for timestamp, x, y in samples]
+        elapsed = time.perf_counter() - start
+        print("  {:<10} {:>7.2f} us/sample   jitter {:>6.2f} px   "
+              "latency {:>5.1f} ms".format(
+                  name, elapsed / len(samples) * 1e6, measure_jitter(points),
+                  measure_latency(samples, points) * 1000))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for trace_path in sys.argv[1:]:
+            run(trace_path, load_trace(trace_path))
+    else:
+        trace = generate_trace()
+        run("synthetic trace", trace)
+        run("synthetic trace, duplicate timestamps",
+            duplicate_timestamps(trace))
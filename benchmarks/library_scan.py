@@ -0,0 +1,101 @@
+"""
+Benchmark of the media library scanning. Generates synthetic directory
+trees with the given numbers of files and measures times of a full scan,
+with a single and with many worker threads, and of a scan backed by
+the persistent index, both a cold one and a repeated one.
+
+Usage: python3 benchmarks/library_scan.py [files count ...]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pisak import media_library
+
+
+ACCEPTED_TYPES = [".jpg", ".png"]
+
+FILES_PER_DIR = 100
+
+DIRS_PER_LEVEL = 10
+
+
+def generate_tree(root, files_count):
+    """
+    Generate a directory tree with the given number of files, spread
+    across nested directories, `FILES_PER_DIR` files in each one.
+    Every tenth file has an extension that is not accepted.
+
+    :param root: path to the root directory.
+    :param files_count: total number of files.
+    """
+    for dir_idx in range(0, -(-files_count // FILES_PER_DIR)):
+        parts = []
+        idx = dir_idx
+        while True:
+            parts.append("dir_{}".format(idx % DIRS_PER_LEVEL))
+            idx //= DIRS_PER_LEVEL
+            if idx == 0:
+                break
+        dir_path = os.path.join(root, *parts)
+        os.makedirs(dir_path, exist_ok=True)
+        first = dir_idx * FILES_PER_DIR
+        for file_idx in range(first, min(first + FILES_PER_DIR, files_count)):
+            ext = ".txt" if file_idx % 10 == 0 else ".jpg"
+            open(os.path.join(dir_path, "file_{}{}".format(file_idx, ext)),
+                 "w").close()
+
+
+def measure(label, func):
+    """
+    Run the given function and print its execution time.
+
+    :param label: label of the measurement.
+    :param func: function to be measured, returning a library.
+    """
+    start = time.perf_counter()
+    library = func()
+    elapsed = time.perf_counter() - start
+    print("  {:<24} {:>9.3f} s   {:>7} items".format(
+        label, elapsed, len(library.get_all_items())))
+
+
+def run(files_count):
+    """
+    Run all the measurements for a tree with the given number of files.
+
+    :param files_count: total number of files.
+    """
+    root = tempfile.mkdtemp(prefix="pisak_scan_")
+    index_dir = tempfile.mkdtemp(prefix="pisak_index_")
+    index_path = os.path.join(index_dir, "library.db")
+    workers = media_library.SCAN_WORKERS
+    try:
+        generate_tree(root, files_count)
+        print("{} files:".format(files_count))
+        media_library.SCAN_WORKERS = 1
+        measure("full scan, 1 thread",
+                lambda: media_library.Library(root, ACCEPTED_TYPES))
+        media_library.SCAN_WORKERS = workers
+        measure("full scan, {} threads".format(workers),
+                lambda: media_library.Library(root, ACCEPTED_TYPES))
+        measure("indexed scan, cold",
+                lambda: media_library.Library(
+                    root, ACCEPTED_TYPES, index_path=index_path))
+        measure("indexed scan, warm",
+                lambda: media_library.Library(
+                    root, ACCEPTED_TYPES, index_path=index_path))
+    finally:
+        media_library.SCAN_WORKERS = workers
+        shutil.rmtree(root)
+        shutil.rmtree(index_dir)
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    for count in counts:
+        run(count)
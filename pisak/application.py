@@ -140,6 +140,8 @@ class _Application(configurator.Configurable):
             loop()
         finally:
             self.main_loop_is_running = False
+            if self.sound_effects_player is not None:
+                self.sound_effects_player.close()
 
     def main(self):
         """
@@ -0,0 +1,118 @@
+"""
+Cache of the cover art of the music folders. Each cover is stored once,
+under the hash of its contents, so that the same image found in many
+folders is shared, in the variants downscaled to the sizes used by the
+audio application views. Folders without any cover get identicons,
+stored in the cache as well, nothing is ever written to the music folders.
+"""
+import os
+import io
+import hashlib
+import threading
+
+from PIL import Image
+
+from pisak import dirs, utils, logger
+
+
+_LOG = logger.get_logger(__name__)
+
+
+"""
+Variant of the cover displayed on the folder tiles.
+"""
+TILE = "tile"
+
+"""
+Variant of the cover displayed next to the playlist.
+"""
+PLAYLIST = "playlist"
+
+"""
+Maximum sizes of the variants, in pixels, both width and height.
+"""
+VARIANT_SIZES = {TILE: 400, PLAYLIST: 600}
+
+_EXTENSION = ".jpg"
+
+
+def store_image(image_path):
+    """
+    Store the given image in the cache, unless it is already there.
+
+    :param image_path: path to the original image.
+
+    :return: path to the playlist variant of the cover, to be saved in
+    the database, see :func:`variant_path`.
+    """
+    with open(image_path, "rb") as file:
+        data = file.read()
+    key = hashlib.sha1(data).hexdigest()
+    return _store(key, lambda: Image.open(io.BytesIO(data)))
+
+
+def store_identicon(name):
+    """
+    Store an identicon generated from the given name in the cache,
+    unless it is already there.
+
+    :param name: string the identicon is generated from.
+
+    :return: path to the playlist variant of the cover, to be saved in
+    the database, see :func:`variant_path`.
+    """
+    key = hashlib.sha1(("identicon:" + name).encode("utf-8")).hexdigest()
+    size = max(VARIANT_SIZES.values())
+    return _store(key, lambda: Image.open(io.BytesIO(
+        utils.produce_identicon(name, size=(size, size)))))
+
+
+def get_path(key, variant):
+    """
+    Get path to the given variant of the cover.
+
+    :param key: hash of the cover.
+    :param variant: one of the variants, `TILE` or `PLAYLIST`.
+
+    :return: path to the file.
+    """
+    return os.path.join(dirs.HOME_COVERS_DIR, key[:2],
+                        "{}_{}{}".format(key, variant, _EXTENSION))
+
+
+def variant_path(cover_path, variant):
+    """
+    Get path to the other variant of the cover with the given path.
+    Paths from outside of the cache, i.e. saved in the database before
+    the cache was introduced, are returned unchanged.
+
+    :param cover_path: path to the playlist variant of the cover.
+    :param variant: one of the variants, `TILE` or `PLAYLIST`.
+
+    :return: path to the file.
+    """
+    suffix = "_{}{}".format(PLAYLIST, _EXTENSION)
+    if cover_path and cover_path.startswith(dirs.HOME_COVERS_DIR) and \
+            cover_path.endswith(suffix):
+        return "{}_{}{}".format(cover_path[:-len(suffix)], variant, _EXTENSION)
+    return cover_path
+
+
+def _store(key, open_image):
+    paths = {variant: get_path(key, variant) for variant in VARIANT_SIZES}
+    if not all(os.path.isfile(path) for path in paths.values()):
+        image = open_image()
+        image.load()
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        dirs.ensure_dir(os.path.dirname(paths[PLAYLIST]))
+        for variant, size in VARIANT_SIZES.items():
+            scaled = image.copy()
+            scaled.thumbnail((size, size), Image.LANCZOS)
+            # write to a temporary file first, so that no other worker or
+            # process ever reads a half-written cover.
+            temp_path = "{}.{}.{}.tmp".format(
+                paths[variant], os.getpid(), threading.get_ident())
+            scaled.save(temp_path, "JPEG", quality=90)
+            os.replace(temp_path, paths[variant])
+    return paths[PLAYLIST]
@@ -4,12 +4,16 @@ Music loading.
 import os
 import re
 import time
-import configobj
+import threading
+import multiprocessing
+from collections import OrderedDict
 
 import taglib
+from gi.repository import Clutter
+from sqlalchemy.exc import SQLAlchemyError
 
-from pisak import res, dirs, utils, logger
-from pisak.audio import db_manager
+from pisak import res, dirs, utils, logger, file_watch
+from pisak.audio import db_manager, covers
 
 
 _LOG = logger.get_logger(__name__)
@@ -20,64 +24,366 @@ _LIBRARY_DIR = dirs.get_user_dir("music")
 _COVER_EXTENSIONS = [
     ".jpg", ".jpeg", ".png", ".bmp"]
 
-_LOAD_TRACKER = os.path.join(dirs.HOME_PISAK_DIR, "music_load_tracker.ini")
-
-_FAKE_COVER_NAME = "fake_cover.png"
+_AUDIO_EXTENSIONS = [
+    ".mp3", ".ogg", ".oga", ".opus", ".flac", ".m4a", ".mp4", ".aac",
+    ".wma", ".wav", ".aif", ".aiff", ".ape", ".mpc", ".wv", ".spx", ".tta"]
 
 _UNKNOWN_LITERAL_TAG = "nieznane"
 
 _UNKNOWN_NUMERICAL_TAG = 0
 
+_WATCHER_STORE = {}
+
+_PROGRESS_STORE = {}
+
+"""
+Functions to be called when the music database has been updated
+with the changes made in the library directory.
+"""
+on_change = file_watch.ChangeNotifier()
+
+"""
+Functions to be called with the numbers of files examined so far
+and of all the files to examine, while the music is being imported.
+"""
+on_progress = file_watch.ChangeNotifier()
+
+"""
+Number of worker processes reading the tracks' tags during the import.
+Workers are spawned, not forked, as forking a process with the GI threads
+running may leave the children with locks that are never released.
+"""
+IMPORT_WORKERS = multiprocessing.cpu_count()
+
+"""
+Number of tracks committed to the database at once during the import.
+"""
+IMPORT_BATCH_SIZE = 500
+
+"""
+Number of seconds that the changes in the library directory are collected
+for before they are saved to the database.
+"""
+WATCH_DELAY = 0.5
 
-def load_all():
+
+def load_all(background=False):
     """
     Load information about the music library in the filesystem and
-    insert them to the database.
+    insert them to the database. Size and modification time of each file
+    are compared with the ones saved in the database, so that only new or
+    changed files are examined again and tracks of the files that do not
+    exist any more are removed.
+    Import runs in stages: changed files are found first, then they are
+    examined in a pool of worker processes, folder by folder, and the tracks
+    are committed to the database in batches of `IMPORT_BATCH_SIZE`.
+    After each batch functions registered with `on_change` are called and
+    functions registered with `on_progress` are called with the numbers of
+    files examined so far and of all the files to examine, on the main loop.
+
+    :param background: whether the import should be run in a separate
+    thread, so that the first folders are available before it is finished.
+
+    :return: thread running the import, if in the background.
     """
-    last_load_time = _get_last_load_time()
-    tracks = list()
+    if background:
+        thread = threading.Thread(target=_import, daemon=True)
+        thread.start()
+        return thread
+    _import()
+
+
+def _import():
     db = db_manager.DBLoader()
-    for current in [_LIBRARY_DIR] + os.listdir(_LIBRARY_DIR):
+    known = db.get_tracks_stats()
+    folders, stats = _discover_changes(known)
+    db.remove_many_tracks([path for path in known if path not in stats])
+    db.close()
+    total = sum(len(changed) for _current, _files, changed in folders)
+    done = 0
+    Clutter.threads_add_idle(0, _notify_progress, (done, total))
+    if not folders:
+        return
+    batch, count = [], 0
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(IMPORT_WORKERS) as pool:
+        # results come in the order of folders, as soon as they are ready:
+        for (current, _files, changed), (cover_path, metas) in zip(
+                folders, pool.imap(_read_folder, folders)):
+            for meta in metas:
+                size, mtime = stats[meta['path']]
+                meta.update({'cover_path': cover_path,
+                             'size': size, 'mtime': mtime})
+            batch.append((current, cover_path, metas))
+            count += len(metas)
+            done += len(changed)
+            if count >= IMPORT_BATCH_SIZE:
+                _commit_batch(batch, known, done, total)
+                batch, count = [], 0
+    if batch:
+        _commit_batch(batch, known, done, total)
+
+
+def _discover_changes(known):
+    """
+    Find all the files in the library and the music files among them
+    that are new or have changed since they were saved in the database.
+    Files of other types are never examined, otherwise they would be
+    found changed on every import, having no tracks in the database.
+
+    :param known: dictionary with paths to the tracks saved in the database
+    and tuples with the sizes and the modification times of their files.
+
+    :return: tuple with list of folders that have any changed files, each
+    being a tuple with path to the folder, list of all its files and list
+    of its changed files, and dictionary with paths to all the music files
+    found and tuples with their sizes and modification times.
+    """
+    folders, stats = [], {}
+    for current in [_LIBRARY_DIR] + sorted(os.listdir(_LIBRARY_DIR)):
         if current is not _LIBRARY_DIR:
             current = os.path.join(_LIBRARY_DIR, current)
-        if os.path.isdir(current) and os.path.getmtime(current) > last_load_time:
-            # use os.walk here only to find all the files in
-            # the current directory:
-            for _, _, files in os.walk(current):
-                if files:
-                    folder_name = os.path.split(current)[-1]
-                    cover_path = utils.find_folder_image(
-                        files, folder_name.lower(), current, _COVER_EXTENSIONS)
-                    if not cover_path:
-                        cover_path = os.path.join(current, _FAKE_COVER_NAME)
-                        utils.produce_identicon(current, save_path=cover_path)
-                    folder_id = db.insert_folder(folder_name, cover_path)
-                    for file_name in files:
-                        path = os.path.join(current, file_name)
-                        meta = _get_metadata(path, file_name)
-                        if meta:
-                            meta.update({'path': path,
-                                         'cover_path': cover_path,
-                                         'folder_id': folder_id})
-                            tracks.append(meta)
-                break
-    db.insert_many_tracks(tracks)
+        if not os.path.isdir(current):
+            continue
+        files, changed = [], []
+        try:
+            for entry in os.scandir(current):
+                if not entry.is_file():
+                    continue
+                files.append(entry.name)
+                if os.path.splitext(entry.name)[-1].lower() not in \
+                        _AUDIO_EXTENSIONS:
+                    continue
+                stat = entry.stat()
+                stats[entry.path] = (stat.st_size, stat.st_mtime)
+                if known.get(entry.path) != stats[entry.path]:
+                    changed.append(entry.name)
+        except OSError as exc:
+            _LOG.warning(exc)
+        if changed:
+            folders.append((current, files, changed))
+    return folders, stats
+
+
+def _read_folder(folder):
+    """
+    Examine the changed files from a single folder,
+    called in a worker process.
+
+    :param folder: tuple with path to the folder, list of all its files
+    and list of its changed files.
+
+    :return: tuple with path to the folder cover and list of
+    metadata of the tracks.
+    """
+    current, files, changed = folder
+    cover_path = _get_folder_cover(current, os.path.split(current)[-1], files)
+    metas = []
+    for file_name in changed:
+        path = os.path.join(current, file_name)
+        meta = _get_metadata(path, file_name)
+        if meta:
+            meta['path'] = path
+            metas.append(meta)
+    return cover_path, metas
+
+
+def _commit_batch(batch, known, done, total):
+    """
+    Save the examined folders and their tracks to the database, in a single
+    transaction, opened only now, so that the database is not locked
+    while the files are being examined.
+
+    :param batch: list of tuples with path to the folder, path to its cover
+    and list of metadata of its tracks.
+    :param known: dictionary with paths to the tracks saved in the database
+    and tuples with the sizes and the modification times of their files.
+    :param done: number of files examined so far.
+    :param total: number of all the files to examine.
+    """
+    db = db_manager.DBLoader()
+    tracks = []
+    for current, cover_path, metas in batch:
+        if metas:
+            folder_id = db.insert_folder(os.path.split(current)[-1],
+                                         cover_path)
+            for meta in metas:
+                meta['folder_id'] = folder_id
+            tracks.extend(metas)
+    db.insert_many_tracks([track for track in tracks
+                           if track['path'] not in known])
+    db.update_many_tracks([track for track in tracks
+                           if track['path'] in known])
+    db.close()
+    Clutter.threads_add_idle(0, _notify_progress, (done, total))
+
+
+def _notify_progress(progress):
+    _PROGRESS_STORE['import'] = progress
+    on_change.notify()
+    on_progress.notify(*progress)
+    return False
+
+
+def get_import_progress():
+    """
+    Get progress of the music import.
+
+    :return: tuple with the numbers of files examined so far and of all
+    the files to examine or None if no import has been started.
+    """
+    return _PROGRESS_STORE.get('import')
+
+
+def watch():
+    """
+    Start watching the library directory and keep the database up to date
+    with any music files added, modified or removed in the meantime.
+    Changes are collected for `WATCH_DELAY` seconds and then saved
+    to the database all at once, in a separate thread. Functions registered
+    with `on_change` are called after each update, on the main loop.
+    """
+    if _LIBRARY_DIR not in _WATCHER_STORE:
+        collector = _ChangesCollector()
+        watcher = file_watch.DirectoryWatcher(
+            _LIBRARY_DIR, collector.add, collector.remove, collector.add,
+            depth=1)
+        watcher.start()
+        _WATCHER_STORE[_LIBRARY_DIR] = watcher
+
+
+class _ChangesCollector:
+    """
+    Collector of the changes in the library directory, reported by the
+    watcher on the main loop, and saver of them, in batches, in a thread.
+    """
+
+    def __init__(self):
+        # changed paths, in order of the latest changes,
+        # path: whether the file has been added or removed.
+        self._changes = OrderedDict()
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    def add(self, path):
+        """
+        Report file that has been added or changed.
+
+        :param path: path to the file.
+        """
+        self._collect(path, True)
+
+    def remove(self, path):
+        """
+        Report file or folder that has been removed.
+
+        :param path: path to the file or the folder.
+        """
+        self._collect(path, False)
+
+    def _collect(self, path, added):
+        with self._condition:
+            self._changes.pop(path, None)
+            self._changes[path] = added
+            self._condition.notify()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._changes:
+                    self._condition.wait()
+            # let the rest of the batch, i.e. a whole album being copied, come:
+            time.sleep(WATCH_DELAY)
+            with self._condition:
+                changes = list(self._changes.items())
+                self._changes.clear()
+            try:
+                changed = _save_changes(changes)
+            except SQLAlchemyError as exc:
+                _LOG.error(exc)
+                continue
+            if changed:
+                Clutter.threads_add_idle(0, _notify_change, None)
+
+
+def _save_changes(changes):
+    """
+    Save changes in the library directory to the database. Added files are
+    examined first, so that the database is written to in a single go.
+
+    :param changes: list of tuples with paths to the files and whether
+    they have been added or removed.
+
+    :return: whether the tracks in the database have changed.
+    """
+    examined, covers_paths = [], {}
+    for path, added in changes:
+        examined.append((path, added,
+                         _examine_file(path, covers_paths) if added else None))
+    db = db_manager.DBLoader()
+    changed = False
+    for path, added, meta in examined:
+        if not added:
+            changed = bool(db.remove_tracks(path)) or changed
+        elif meta:
+            meta['folder_id'] = db.insert_folder(meta.pop('folder_name'),
+                                                 meta['cover_path'])
+            db.save_track(meta)
+            changed = True
     db.close()
-    _update_last_load_time(time.time())
+    return changed
+
+
+def _examine_file(path, covers_paths):
+    """
+    Examine a file added to the library directory.
 
+    :param path: path to the file.
+    :param covers_paths: dictionary of covers of the folders examined
+    so far, keyed by the folders paths, updated with the new ones.
 
-def _get_last_load_time():
-    if not os.path.isfile(_LOAD_TRACKER):
-        return 0
-    else:
-        return configobj.ConfigObj(
-            _LOAD_TRACKER, encoding='UTF8').as_float("last_load_time")
+    :return: metadata of the track, with the name of its folder,
+    or None if the file is not a track.
+    """
+    current, file_name = os.path.split(path)
+    library_dir = os.path.normpath(_LIBRARY_DIR)
+    if os.path.splitext(file_name)[-1].lower() not in _AUDIO_EXTENSIONS or \
+            library_dir not in (current, os.path.dirname(current)):
+        return None
+    meta = _get_metadata(path, file_name)
+    if not meta:
+        return None
+    folder_name = os.path.split(current)[-1]
+    try:
+        stat = os.stat(path)
+        if current not in covers_paths:
+            covers_paths[current] = _get_folder_cover(
+                current, folder_name, os.listdir(current))
+    except OSError as exc:
+        _LOG.warning(exc)
+        return None
+    meta.update({'path': path,
+                 'cover_path': covers_paths[current],
+                 'folder_name': folder_name,
+                 'size': stat.st_size, 'mtime': stat.st_mtime})
+    return meta
+
+
+def _notify_change(_data):
+    on_change.notify()
+    return False
 
 
-def _update_last_load_time(time):
-    conf = configobj.ConfigObj(_LOAD_TRACKER, encoding='UTF8')
-    conf["last_load_time"] = time
-    conf.write()
+def _get_folder_cover(folder, folder_name, files):
+    image_path = utils.find_folder_image(
+        files, folder_name.lower(), folder, _COVER_EXTENSIONS)
+    if image_path:
+        try:
+            return covers.store_image(image_path)
+        except OSError as exc:
+            _LOG.warning("Could not store cover {}: {}.".format(image_path, exc))
+    return covers.store_identicon(folder)
 
 
 def _get_metadata(path, file_name):
@@ -2,12 +2,16 @@
 Music database management.
 """
 import os
+import threading
 
-from sqlalchemy import Table, Column, Integer, String, Boolean, MetaData, \
-    ForeignKey, select, create_engine
+from sqlalchemy import Table, Column, Integer, String, Boolean, Float, MetaData, \
+    ForeignKey, select, exists, func, bindparam, event, inspect, text, \
+    create_engine
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import SingletonThreadPool
+from sqlalchemy.util import LRUCache
 
-from pisak import dirs, logger
+from pisak import dirs, logger, media_search
 
 
 _FAVOURITES_FOLDER_ALIAS = 'ULUBIONE'
@@ -39,39 +43,222 @@ tracks = Table('tracks', metadata,
         Column('album', String, nullable=True),
         Column('genre', String, nullable=True),
         Column('artist', String, nullable=True),
-        Column('favourite', Boolean, default=False),
-        Column('folder_id', Integer, ForeignKey('folders.id'), nullable=True)
+        Column('favourite', Boolean, default=False, index=True),
+        Column('folder_id', Integer, ForeignKey('folders.id'), nullable=True,
+               index=True),
+        Column('size', Integer, nullable=True),
+        Column('mtime', Float, nullable=True)
 )
 
 
-engine = create_engine(_ENGINE_URL)
+engine = create_engine(_ENGINE_URL, poolclass=SingletonThreadPool)
 
-metadata.create_all(engine)
 
+@event.listens_for(engine, 'connect')
+def _configure_connection(dbapi_connection, _connection_record):
+    # write-ahead log lets readers work alongside a writer and makes
+    # commits cheaper, it is a persistent setting of the database file.
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
 
-class DBConnector:
+
+def _migrate():
+    # `create_all` skips the tables that already exist, databases created
+    # before some columns or indexes were declared need them too.
+    inspector = inspect(engine)
+    existing = set(column['name'] for column in
+                   inspector.get_columns(tracks.name))
+    for column in tracks.columns:
+        if column.name not in existing:
+            engine.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                tracks.name, column.name,
+                column.type.compile(engine.dialect)))
+    existing = set(index['name'] for index in
+                   inspector.get_indexes(tracks.name))
+    for index in tracks.indexes:
+        if index.name not in existing:
+            index.create(engine)
+
+
+"""
+Columns of the tracks that are indexed for the full-text search.
+"""
+_SEARCHABLE_COLUMNS = ('title', 'artist', 'album', 'genre')
+
+
+def _create_search_index():
+    # external content table, the tracks are not copied, only indexed,
+    # and the index is kept in sync with the tracks by the triggers.
+    # Indexed values have the `media_search.FOLDED_LETTERS` replaced.
+    # Index made by an older version, with other definitions, is rebuilt.
+    columns = ', '.join(_SEARCHABLE_COLUMNS)
+    values = {prefix: ', '.join(media_search.fold_sql(prefix + column)
+                                for column in _SEARCHABLE_COLUMNS)
+              for prefix in ('old.', 'new.', '')}
+    definitions = [
+        "CREATE VIRTUAL TABLE tracks_search USING fts5({columns}, "
+        "content='tracks', content_rowid='id', tokenize='{tokenizer}', "
+        "prefix='{prefixes}')",
+        "CREATE TRIGGER tracks_search_insert AFTER INSERT ON tracks BEGIN "
+        "INSERT INTO tracks_search (rowid, {columns}) "
+        "VALUES (new.id, {new}); END",
+        "CREATE TRIGGER tracks_search_delete AFTER DELETE ON tracks BEGIN "
+        "INSERT INTO tracks_search (tracks_search, rowid, {columns}) "
+        "VALUES ('delete', old.id, {old}); END",
+        "CREATE TRIGGER tracks_search_update AFTER UPDATE OF {columns} "
+        "ON tracks BEGIN "
+        "INSERT INTO tracks_search (tracks_search, rowid, {columns}) "
+        "VALUES ('delete', old.id, {old}); "
+        "INSERT INTO tracks_search (rowid, {columns}) "
+        "VALUES (new.id, {new}); END"]
+    definitions = [definition.format(
+        columns=columns, old=values['old.'], new=values['new.'],
+        tokenizer=media_search.TOKENIZER, prefixes=media_search.PREFIXES)
+        for definition in definitions]
+    try:
+        with engine.begin() as conn:
+            existing = set(row[0] for row in conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name IN ('tracks_search', "
+                "'tracks_search_insert', 'tracks_search_delete', "
+                "'tracks_search_update')"))
+            if existing == set(definitions):
+                return
+            for trigger in ('insert', 'delete', 'update'):
+                conn.execute(
+                    "DROP TRIGGER IF EXISTS tracks_search_" + trigger)
+            conn.execute("DROP TABLE IF EXISTS tracks_search")
+            for definition in definitions:
+                conn.execute(definition)
+            conn.execute(
+                "INSERT INTO tracks_search (rowid, {}) SELECT id, {} "
+                "FROM tracks".format(columns, values['']))
+    except SQLAlchemyError as exc:
+        _LOG.warning("Search index is not available: {}.".format(exc))
+
+
+_PREPARED_STORE = {}
+
+_PREPARED_LOCK = threading.Lock()
+
+
+def _prepare_database():
     """
-    Database connector.
+    Create, migrate and index the database, just once, before the first
+    connection, rather than on import, so that processes that import the
+    module without using the database, i.e. the import workers, do not
+    touch it at all.
     """
+    with _PREPARED_LOCK:
+        if _PREPARED_STORE.get('prepared'):
+            return
+        metadata.create_all(engine)
+        _migrate()
+        _create_search_index()
+        _PREPARED_STORE['prepared'] = True
 
-    def __init__(self):
-        self._conn = None
+
+"""
+Cache of the compiled statements, shared by all the connections,
+so that each of the statements below is compiled only once.
+"""
+_COMPILED_CACHE = LRUCache(100)
+
+_LOCAL = threading.local()
+
+
+_COUNT_FOLDERS = select([func.count()]).select_from(folders)
+
+_SELECT_FOLDERS_WITH_TRACKS_COUNT = select(
+    [folders, func.count(tracks.c.id).label('tracks_count')]).select_from(
+    folders.outerjoin(tracks, tracks.c.folder_id == folders.c.id)).group_by(
+    folders.c.id)
+
+_SELECT_FOLDERS_IDS = select([folders.c.id])
+
+_FOLDER_EXISTS = select([exists().where(
+    folders.c.id == bindparam('folder_id'))])
+
+_DELETE_EMPTY_FOLDERS = folders.delete().where(~exists().where(
+    tracks.c.folder_id == folders.c.id))
+
+_SELECT_FOLDER_ID = select([folders.c.id]).where(
+    folders.c.name == bindparam('folder_name'))
+
+_INSERT_FOLDER = folders.insert().prefix_with('OR IGNORE')
+
+_UPDATE_FOLDER_COVER = folders.update().where(
+    folders.c.id == bindparam('folder_id')).values(
+    cover_path=bindparam('folder_cover_path'))
+
+_FAVOURITES_EXIST = select([exists().where(tracks.c.favourite)])
+
+_SELECT_SAMPLE_FAVOURITE_COVER = select([tracks.c.cover_path]).where(
+    tracks.c.favourite).limit(1)
+
+_SELECT_FAVOURITE_TRACKS = select([tracks]).where(tracks.c.favourite)
+
+_SELECT_FOLDER_TRACKS = select([tracks]).where(
+    tracks.c.folder_id == bindparam('folder_id')).order_by(tracks.c.no)
+
+_SELECT_IS_FAVOURITE = select([tracks.c.favourite]).where(
+    tracks.c.path == bindparam('track_path'))
+
+_UPDATE_FAVOURITE = tracks.update().where(
+    tracks.c.path == bindparam('track_path')).values(
+    favourite=bindparam('is_favourite'))
+
+_SELECT_TRACKS_STATS = select([tracks.c.path, tracks.c.size, tracks.c.mtime])
+
+_DELETE_TRACK_BY_PATH = tracks.delete().where(
+    tracks.c.path == bindparam('track_path'))
+
+_UPDATE_TRACK_BY_PATH = tracks.update().where(
+    tracks.c.path == bindparam('track_path'))
+
+_INSERT_TRACKS = tracks.insert().prefix_with('OR IGNORE')
+
+_SEARCH_TRACKS = text(
+    "SELECT tracks.* FROM tracks_search "
+    "JOIN tracks ON tracks.id = tracks_search.rowid "
+    "WHERE tracks_search MATCH :match ORDER BY rank LIMIT :limit")
+
+
+def _get_connection():
+    """
+    Get connection to the database for the current thread. Each thread
+    uses its own connection, opened on the first use and then kept open.
+
+    :return: connection instance.
+    """
+    connection = getattr(_LOCAL, 'connection', None)
+    if connection is None or connection.closed:
+        _prepare_database()
+        connection = engine.connect().execution_options(
+            compiled_cache=_COMPILED_CACHE)
+        _LOCAL.connection = connection
+    return connection
+
+
+class DBConnector:
+    """
+    Database connector. Statements are executed on the long-lived
+    connection of the current thread.
+    """
 
     def _execute(self, *args, **kwargs):
         try:
-            if not self._conn:
-                self._conn = engine.connect()
-            return self._conn.execute(*args, **kwargs)
+            return _get_connection().execute(*args, **kwargs)
         except SQLAlchemyError as exc:
             _LOG.error(exc)
 
-    def _close_connection(self):
-        if self._conn:
-            try:
-                self._conn.close()
-                self._conn = None
-            except SQLAlchemyError as exc:
-                _LOG.error(exc)
+    def _scalar(self, *args, **kwargs):
+        ret = self._execute(*args, **kwargs)
+        return ret.scalar() if ret else None
+
+    def _has_favourites(self):
+        return bool(self._scalar(_FAVOURITES_EXIST))
 
     def get_folder_count(self):
         """
@@ -79,11 +266,8 @@ class DBConnector:
 
         :return: integer, number of folders.
         """
-        favs = 1 if self._execute(select([tracks]).where(
-            tracks.c.favourite)).fetchone() else 0
-        count = len(self._execute(select([folders])).fetchall()) + favs
-        self._close_connection()
-        return count
+        favs = 1 if self._has_favourites() else 0
+        return (self._scalar(_COUNT_FOLDERS) or 0) + favs
 
     def get_folders_ids(self):
         """
@@ -93,33 +277,27 @@ class DBConnector:
         including -1 for fake favourites if there are any favourite tracks.
         """
         ids = [row['id'] for row in
-               self._execute(select([folders.c.id])).fetchall()]
-        if self._execute(select([tracks]).where(
-                tracks.c.favourite)).fetchone():
+               self._execute(_SELECT_FOLDERS_IDS).fetchall()]
+        if self._has_favourites():
             ids.insert(0, -1)  # for fake favourites folder
-        self._close_connection()
         return ids
 
     def get_all_folders(self):
         """
-        Get all available folders.
+        Get all available folders. Folders without any tracks
+        are removed from the database.
 
         :return: list of all folders.
         """
-        folders_list = self._execute(select([folders])).fetchall()
-        for folder in folders_list:
-            if not self._execute(select([tracks]).where(
-                    tracks.c.folder_id == folder['id'])).fetchone():
-                self._execute(folders.delete().where(
-                    folders.c.id == folder['id']))
-                folders_list.remove(folder)
+        rows = self._execute(_SELECT_FOLDERS_WITH_TRACKS_COUNT).fetchall()
+        folders_list = [folder for folder in rows if folder['tracks_count']]
+        if len(folders_list) < len(rows):
+            self._execute(_DELETE_EMPTY_FOLDERS)
         self._include_fake_favourites_folder(folders_list)
-        self._close_connection()
         return folders_list
 
     def _include_fake_favourites_folder(self, folders_list):
-        sample_fav = self._execute(select([tracks.c.cover_path]).where(
-            tracks.c.favourite)).fetchone()
+        sample_fav = self._execute(_SELECT_SAMPLE_FAVOURITE_COVER).fetchone()
         if sample_fav:
             folders_list.append({'id': -1,
                                  'name': _FAVOURITES_FOLDER_ALIAS,
@@ -134,19 +312,16 @@ class DBConnector:
         :return: list of tracks.
         """
         if self._is_folder(folder_id):
-            ret = self._execute(select([tracks]).where(
-                tracks.c.folder_id == folder_id).order_by(tracks.c.no)).fetchall()
+            return self._execute(
+                _SELECT_FOLDER_TRACKS, folder_id=folder_id).fetchall()
         else:
-            ret = self._get_favourite_tracks()
-        self._close_connection()
-        return ret
+            return self._get_favourite_tracks()
 
     def _is_folder(self, folder_id):
-        return self._execute(select([folders]).where(
-            folders.c.id == folder_id)).fetchone()
+        return self._scalar(_FOLDER_EXISTS, folder_id=folder_id)
 
     def _get_favourite_tracks(self):
-        return self._execute(select([tracks]).where(tracks.c.favourite)).fetchall()
+        return self._execute(_SELECT_FAVOURITE_TRACKS).fetchall()
 
     def is_track_in_favourites(self, track_path):
         """
@@ -156,10 +331,23 @@ class DBConnector:
 
         :return: True or False.
         """
-        ret = self._execute(select([tracks.c.favourite]).where(
-            tracks.c.path == track_path)).fetchone()['favourite']
-        self._close_connection()
-        return ret
+        return bool(self._scalar(_SELECT_IS_FAVOURITE, track_path=track_path))
+
+    def search_tracks(self, query, limit=media_search.RESULTS_LIMIT):
+        """
+        Find tracks whose titles, artists, albums or genres contain
+        words starting with the given words.
+
+        :param query: text typed in by the user.
+        :param limit: maximum number of the results.
+
+        :return: list of tracks, the best matches first.
+        """
+        match = media_search.make_prefix_query(query)
+        if not match:
+            return []
+        ret = self._execute(_SEARCH_TRACKS, match=match, limit=limit)
+        return ret.fetchall() if ret else []
 
     def remove_track_from_favourites(self, track_path):
         """
@@ -178,29 +366,31 @@ class DBConnector:
         self._toggle_favourite(track_path, True)
 
     def _toggle_favourite(self, track_path, boolean):
-        self._execute(tracks.update().where(
-            tracks.c.path == track_path).values(favourite=boolean))
-        self._close_connection()
+        self._execute(_UPDATE_FAVOURITE, track_path=track_path,
+                      is_favourite=boolean)
 
 
 class DBLoader(DBConnector):
     """
-    Use this to update the music library.
-    Use `close` method when done.
+    Use this to update the music library. All the changes are made
+    in a single transaction, committed by the `close` method,
+    so use it when done.
     """
 
     def __init__(self):
         super().__init__()
-        self._collect_garbage()
+        self._transaction = _get_connection().begin()
 
-    def _collect_garbage(self):
+    def get_tracks_stats(self):
         """
-        Clear the db from all the non existing files.
+        Get sizes and modification times of the files of all the tracks,
+        as they were when the tracks were saved.
+
+        :return: dictionary with paths to the tracks as keys and tuples
+        with the sizes and the modification times as values.
         """
-        for track in self._execute(select([tracks])).fetchall():
-            if not os.path.isfile(track['path']):
-                self._execute(
-                    tracks.delete().where(tracks.c.id == track['id']))
+        return {row['path']: (row['size'], row['mtime']) for row in
+                self._execute(_SELECT_TRACKS_STATS).fetchall()}
 
     def insert_many_tracks(self, tracks_list):
         """
@@ -208,29 +398,85 @@ class DBLoader(DBConnector):
 
         :param tracks_list: list of dictionaries with the tracks.
         """
-        self._execute(
-            tracks.insert().prefix_with('OR IGNORE'), tracks_list)
+        if tracks_list:
+            self._execute(_INSERT_TRACKS, tracks_list)
+
+    def update_many_tracks(self, tracks_list):
+        """
+        Update many tracks already existing in the db, matched by their paths.
+        Favourite flags of the tracks are preserved.
+
+        :param tracks_list: list of dictionaries with the tracks,
+        all with the same keys.
+        """
+        if tracks_list:
+            self._execute(_UPDATE_TRACK_BY_PATH, [
+                dict(track, track_path=track['path']) for track in tracks_list])
+
+    def remove_many_tracks(self, paths):
+        """
+        Remove many tracks from the db.
+
+        :param paths: list of paths to the tracks.
+        """
+        if paths:
+            self._execute(_DELETE_TRACK_BY_PATH,
+                          [{'track_path': path} for path in paths])
+
+    def save_track(self, track):
+        """
+        Save single track to the db, update the already existing record
+        with the same path or insert a new one. Favourite flag of the
+        already existing record is preserved.
+
+        :param track: dictionary with the track.
+        """
+        ret = self._execute(tracks.update().where(
+            tracks.c.path == track['path']).values(**track))
+        if not ret or not ret.rowcount:
+            self._execute(_INSERT_TRACKS, track)
+
+    def remove_tracks(self, path):
+        """
+        Remove track with the given path or, if the path points to
+        a folder, all the tracks from inside the folder.
+
+        :param path: path to the track or to the folder.
+
+        :return: number of the removed tracks.
+        """
+        prefix = path.rstrip(os.sep) + os.sep
+        ret = self._execute(tracks.delete().where(
+            (tracks.c.path == path) |
+            (func.substr(tracks.c.path, 1, len(prefix)) == prefix)))
+        return ret.rowcount if ret else 0
 
     def insert_folder(self, name, cover_path):
         """
-        Insert single folder to the db.
+        Insert single folder to the db. Cover of the already
+        existing folder is updated.
 
         :param name: name of the folder.
         :param cover_path: path to a cover of the given folder.
 
         :return: rowid of the inserted or already existing record.
         """
-        ret = self._execute(folders.insert().prefix_with('OR IGNORE'),
-                name=name, cover_path=cover_path)
-        if ret and ret.inserted_primary_key[0]:
+        ret = self._execute(_INSERT_FOLDER, name=name, cover_path=cover_path)
+        if ret and ret.rowcount and ret.inserted_primary_key[0]:
             rowid = ret.inserted_primary_key[0]
         else:
-            rowid = self._execute(select([folders.c.id]).where(
-                folders.c.name == name)).fetchone()['id']
+            rowid = self._scalar(_SELECT_FOLDER_ID, folder_name=name)
+            self._execute(_UPDATE_FOLDER_COVER, folder_id=rowid,
+                          folder_cover_path=cover_path)
         return rowid
 
     def close(self):
         """
-        Close the db loader, close any open connections.
+        Close the db loader, commit all the changes. Connection
+        itself stays open, to be reused by the current thread.
         """
-        self._close_connection()
+        try:
+            self._transaction.commit()
+        except SQLAlchemyError as exc:
+            _LOG.error(exc)
+            self._transaction.rollback()
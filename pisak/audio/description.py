@@ -5,7 +5,7 @@ Descriptor for PISAK audio app.
 from pisak import handlers
 
 import pisak.audio.handlers  # @UnusedImport
-from pisak.audio import widgets  # @UnusedImport
+from pisak.audio import widgets, data_loader  # @UnusedImport
 
 
 def prepare_folders_view(app, window, script, data):
@@ -20,8 +20,21 @@ def prepare_folders_view(app, window, script, data):
     def _folder_tile_handler(tile, playlist_id):
         window.load_view("audio/playlist", {"playlist_id": playlist_id})
 
+    def _on_import_progress(done, total):
+        if done < total:
+            header.set_text("Wczytywanie muzyki: {}%".format(100 * done // total))
+        else:
+            header.set_text("")
+
     data_source = script.get_object("data_source")
     data_source.item_handler = _folder_tile_handler
+    header = script.get_object("header")
+    progress = data_loader.get_import_progress()
+    if progress:
+        _on_import_progress(*progress)
+    data_loader.on_progress.add(_on_import_progress)
+    header.connect("destroy", lambda *_:
+                   data_loader.on_progress.remove(_on_import_progress))
     handlers.button_to_view(window, script, "button_exit")
     data_source.emit('data-is-ready')
 
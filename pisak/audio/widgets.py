@@ -4,7 +4,7 @@ Module containing widgets specific to the Pisak audio player application.
 from gi.repository import Mx, GObject
 
 from pisak import res, widgets, configurator, properties, pager
-from pisak.audio import db_manager
+from pisak.audio import db_manager, data_loader, covers
 
 
 class FoldersSource(pager.DataSource):
@@ -15,8 +15,15 @@ class FoldersSource(pager.DataSource):
 
     def __init__(self):
         super().__init__()
-        self.data = db_manager.DBConnector().get_all_folders()
-        
+        self._on_library_change()
+        data_loader.on_change.add(self._on_library_change)
+
+    def _on_library_change(self):
+        folders = db_manager.DBConnector().get_all_folders()
+        if [tuple(folder) for folder in folders] != \
+                [tuple(folder) for folder in self.data]:
+            self.data = folders
+
     def _produce_item(self, folder):
         tile = widgets.PhotoTile()
         self._prepare_item(tile)
@@ -24,7 +31,7 @@ class FoldersSource(pager.DataSource):
         tile.hilite_tool = widgets.Aperture()
         tile.connect("clicked", self.item_handler, folder['id'])
         tile.scale_mode = Mx.ImageScaleMode.FIT
-        tile.preview_path = folder['cover_path']
+        tile.load_preview(covers.variant_path(folder['cover_path'], covers.TILE))
         tile.label_text = folder['name']
         return tile
 
@@ -40,6 +47,30 @@ class PlaylistSource(pager.DataSource):
         self.data_sets_ids_list = db.get_folders_ids()
         self.data_sets_count = len(self.data_sets_ids_list)
         self.data_generator = db.get_tracks_from_folder
+        data_loader.on_change.add(self._on_library_change)
+
+    def _on_library_change(self):
+        idx = self.data_set_idx
+        folder_id = self.data_sets_ids_list[idx - 1] if idx is not None \
+            and 0 < idx <= len(self.data_sets_ids_list) else None
+        db = db_manager.DBConnector()
+        self.data_sets_ids_list = db.get_folders_ids()
+        self.data_sets_count = len(self.data_sets_ids_list)
+        if folder_id is None:
+            return
+        if folder_id not in self.data_sets_ids_list:
+            # current folder is gone, together with all its tracks:
+            self._data_set_idx = min(idx, self.data_sets_count) or None
+            self.data = []
+            return
+        # follow the current folder to its new position on the list,
+        # without going through the `data_set_idx` setter that would
+        # reload the playlist:
+        self._data_set_idx = self.data_sets_ids_list.index(folder_id) + 1
+        tracks = db.get_tracks_from_folder(folder_id)
+        if [tuple(track) for track in tracks] != \
+                [tuple(track) for track in self.data]:
+            self.data = tracks
 
     def _produce_item(self, track):
         button = widgets.Button()
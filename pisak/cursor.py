@@ -2,10 +2,12 @@
 Module handles cursor-style (stream of coordinates) input in JSON layout.
 """
 import time
+import threading
 
-from gi.repository import GObject, Clutter
+from gi.repository import GObject, GLib, Clutter
 
-from pisak import logger, scanning, configurator, layout, unit, tracker
+from pisak import logger, scanning, configurator, layout, unit, tracker, \
+    spatial, smoothing
 
 _LOG = logger.get_logger(__name__)
 
@@ -14,7 +16,12 @@ class Sprite(layout.Bin, configurator.Configurable):
     """
     Sprite (virtual cursor) object. It displays a big dot in a bright color
     on the screen which follows input coordinates and selects GUI controls
-    on a timeouted hover.
+    on a timeouted hover. Clickable widgets are found with a spatial index
+    of their screen areas, rebuilt only when any widget has changed its
+    allocation, has been mapped or unmapped, added or removed.
+    Samples coming from the tracker are passed to the main loop through
+    a single-slot mailbox, so that only the newest one is rendered and
+    the cursor never replays the stale ones when the main loop is busy.
     """
 
     __gtype_name__ = "PisakSprite"
@@ -24,21 +31,37 @@ class Sprite(layout.Bin, configurator.Configurable):
             GObject.TYPE_UINT,
             "", "",
             0, GObject.G_MAXUINT, 1600,
+            GObject.PARAM_READWRITE),
+        "smoothing": (
+            GObject.TYPE_STRING,
+            "", "",
+            "none",
             GObject.PARAM_READWRITE)
     }
     
     def __init__(self):
         super().__init__()
         self._timeout = 1
+        self._smoothing = "none"
+        self._filter = smoothing.NullFilter()
 
         self.container = None
         self.clickables = None
+        self._index = None
         self._running = False
         self.hover_start = None
         self.hover_actor = None
         self.initial_position = (-10, -10)
-        self.all_rescan = []
+        # actors connected to the rescan handlers:
+        self.all_rescan = set()
         self.coords = (0, 0)
+        # newest sample waiting for the main loop and whether
+        # delivering it has already been scheduled:
+        self._mailbox_lock = threading.Lock()
+        self._latest_coords = None
+        self._delivery_pending = False
+        # number of samples replaced by the newer ones before rendering:
+        self.dropped_samples = 0
         self.set_x_expand(True)
         self.set_y_expand(True)
         self._init_sprite()
@@ -55,6 +78,7 @@ class Sprite(layout.Bin, configurator.Configurable):
 
     def _rescan(self, *source):
         self.clickables = None
+        self._index = None
 
     def _do_disconnect(self, obj, func):
         try:
@@ -63,19 +87,49 @@ class Sprite(layout.Bin, configurator.Configurable):
             _LOG.warning(e)
 
     def _disconnect_rescan(self):
-        self._do_disconnect(self.container, self._rescan)
         for obj in self.all_rescan:
-            self._do_disconnect(obj, self._rescan)
+            self._disconnect_actor(obj)
+        self.all_rescan = set()
+
+    def _disconnect_actor(self, actor):
+        self._do_disconnect(actor, self._rescan)
+        self._do_disconnect(actor, self._on_actor_added)
+        self._do_disconnect(actor, self._on_actor_removed)
 
     def _connect_rescan(self):
-        self.all_rescan = []
-        self.container.connect("allocation-changed", self._rescan)
-        to_conn = self.container.get_children()
+        self.all_rescan = set()
+        self._connect_tree(self.container)
+
+    def _connect_tree(self, actor):
+        to_conn = [actor]
         while len(to_conn) > 0:
             current = to_conn.pop()
+            if current is self or current in self.all_rescan:
+                continue
             current.connect("allocation-changed", self._rescan)
-            self.all_rescan.append(current)
-            to_conn = to_conn + current.get_children()
+            current.connect("notify::mapped", self._rescan)
+            current.connect("actor-added", self._on_actor_added)
+            current.connect("actor-removed", self._on_actor_removed)
+            self.all_rescan.add(current)
+            to_conn.extend(current.get_children())
+
+    def _disconnect_tree(self, actor):
+        to_disconn = [actor]
+        while len(to_disconn) > 0:
+            current = to_disconn.pop()
+            if current in self.all_rescan:
+                self._disconnect_actor(current)
+                self.all_rescan.discard(current)
+                to_disconn.extend(current.get_children())
+
+    def _on_actor_added(self, _container, actor):
+        if actor is not self:
+            self._connect_tree(actor)
+            self._rescan()
+
+    def _on_actor_removed(self, _container, actor):
+        self._disconnect_tree(actor)
+        self._rescan()
 
     @property
     def timeout(self):
@@ -87,7 +141,20 @@ class Sprite(layout.Bin, configurator.Configurable):
     @timeout.setter
     def timeout(self, value):
         self._timeout = int(value) / 1000
-    
+
+    @property
+    def smoothing(self):
+        """
+        Name of the filter smoothing the coordinates, one of
+        `smoothing.FILTERS`. Default is 'none'.
+        """
+        return self._smoothing
+
+    @smoothing.setter
+    def smoothing(self, value):
+        self._smoothing = value
+        self._filter = smoothing.create_filter(value)
+
     def parse_coords(self, data):
         """
         Parses raw data line into x-y coordinates tuple.
@@ -131,10 +198,25 @@ class Sprite(layout.Bin, configurator.Configurable):
             if isinstance(current, scanning.Scannable):
                 if not current.is_disabled():
                     clickables.append(current)
-            to_scan = to_scan + current.get_children()
+            to_scan.extend(current.get_children())
         self.clickables = clickables
         _LOG.debug("clickables: {}".format(clickables))
-    
+
+    def _build_index(self):
+        """
+        Index screen areas of the clickables that are visible. Positions
+        and sizes are read just here, once per any change of the layout.
+        """
+        if self.clickables is None:
+            self.scan_clickables()
+        index = spatial.GridIndex()
+        for clickable in self.clickables:
+            if clickable.is_mapped():
+                (x, y), (w, h) = clickable.get_transformed_position(), \
+                                 clickable.get_size()
+                index.insert(clickable, x, y, w, h)
+        self._index = index
+
     def find_actor(self, coords):
         """
         Looks for any widget positioned at a given coordinates.
@@ -144,14 +226,9 @@ class Sprite(layout.Bin, configurator.Configurable):
 
         :return: some found widget or None.
         """
-        if self.clickables is None:
-            self.scan_clickables()
-        for clickable in self.clickables:
-            (x, y), (w, h) = clickable.get_transformed_position(), clickable.get_size()
-            if (x <= coords[0]) and (coords[0] <= x + w) \
-                    and (y <= coords[1]) and (coords[1] <= y + h):
-                return clickable
-        return None
+        if self._index is None:
+            self._build_index()
+        return self._index.find(coords[0], coords[1])
 
     def on_new_coords(self, x, y):
         """
@@ -191,13 +268,51 @@ class Sprite(layout.Bin, configurator.Configurable):
 
     def on_new_data(self, data):
         """
-        Receives new raw data, parses them and schedules
-        calling the main thread callback.
+        Receives new raw data, parses them and puts them in the mailbox,
+        replacing any sample that has not been rendered yet. Schedules
+        calling the main thread callback, unless it is already scheduled.
 
         :param data: raw data.
         """
         x, y = self.parse_coords(data)
-        Clutter.threads_add_timeout(-100, 20, self.on_new_coords, x, y)
+        self._post(self._filter.filter(x, y, time.monotonic()))
+
+    def on_new_samples(self, samples):
+        """
+        Receives a batch of already parsed samples, passes all of them
+        through the smoothing filter and puts the last one in the mailbox,
+        like :func:`on_new_data`.
+
+        :param samples: list of (timestamp, x, y) tuples, coordinates
+        being fractions of the screen width and height.
+        """
+        if not samples:
+            return
+        width, height = unit.size_pix.width, unit.size_pix.height
+        for timestamp, x, y in samples:
+            coords = self._filter.filter(x * width, y * height, timestamp)
+        self._post(coords, len(samples) - 1)
+
+    def _post(self, coords, skipped=0):
+        with self._mailbox_lock:
+            self.dropped_samples += skipped
+            if self._latest_coords is not None:
+                self.dropped_samples += 1
+            self._latest_coords = coords
+            if self._delivery_pending:
+                return
+            self._delivery_pending = True
+        Clutter.threads_add_idle(GLib.PRIORITY_HIGH, self._deliver_latest,
+                                 None)
+
+    def _deliver_latest(self, _data):
+        with self._mailbox_lock:
+            coords = self._latest_coords
+            self._latest_coords = None
+            self._delivery_pending = False
+        if coords is not None and self._running:
+            self.on_new_coords(*coords)
+        return False
 
     def run(self, container):
         """
@@ -220,6 +335,7 @@ class Sprite(layout.Bin, configurator.Configurable):
         """
         self._running = False
         self.tracker_client.deactivate()
+        _LOG.debug("Gaze samples dropped: {}.".format(self.dropped_samples))
         self.container.remove_child(self)
         self._disconnect_rescan()
         self.container = None
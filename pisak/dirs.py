@@ -111,6 +111,24 @@ during scanning and button selection.
 """
 HOME_SOUNDS_DIR = ensure_dir(os.path.join(HOME_PISAK_DIR, "sounds"))
 
+"""
+Folder with downscaled previews of photos and covers, generated
+and stored according to the freedesktop.org thumbnail specification.
+"""
+HOME_THUMBNAILS_DIR = ensure_dir(os.path.join(HOME_PISAK_DIR, "thumbnails"))
+
+"""
+Folder with cover art of the music folders, downscaled
+to the sizes required by the audio application views.
+"""
+HOME_COVERS_DIR = ensure_dir(os.path.join(HOME_PISAK_DIR, "covers"))
+
+"""
+Folder with the rendered speech, for the labels that are read out
+during scanning.
+"""
+HOME_SPEECH_DIR = ensure_dir(os.path.join(HOME_PISAK_DIR, "speech"))
+
 """
 Path to the spreadsheet containing custom symbols topology for
 "symboler" application.
@@ -133,6 +151,12 @@ Path to the symbols entries file generated by "symboler" application.
 """
 HOME_SYMBOLS_ENTRY = os.path.join(HOME_PISAK_DIR, "symbols_entry.ini")
 
+"""
+Path to the trace file with the gaze samples recorded from the tracker
+and replayed by the "eyetracker-replay" input.
+"""
+HOME_GAZE_TRACE = os.path.join(HOME_PISAK_DIR, "gaze.trace")
+
 """
 Path to a file containing all information and list of URLs to blogs that are being
 followed by the user.
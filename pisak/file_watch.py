@@ -0,0 +1,208 @@
+"""
+Watching the file system for changes, so that media libraries can be kept
+up to date without rescanning them.
+"""
+import os
+import weakref
+import threading
+from collections import deque
+
+from gi.repository import Gio, GLib
+
+from pisak import logger
+
+
+_LOG = logger.get_logger(__name__)
+
+
+"""
+Number of directories that start being watched in a single go on the main
+loop, so that starting to watch a large tree does not block it for long.
+"""
+WATCH_CHUNK_SIZE = 100
+
+
+class DirectoryWatcher:
+    """
+    Watcher of a directory tree, based on `Gio.FileMonitor` instances,
+    one for each directory. Reports files that have been added, changed or
+    removed; events are delivered on the main loop. Directories created
+    or moved into the tree are watched as well and files already placed
+    inside them are reported as added.
+
+    :param path: path to the root directory.
+    :param on_added: function called with a path to a new file.
+    :param on_removed: function called with a path to a removed file or
+    directory.
+    :param on_changed: function called with a path to a file whose contents
+    have changed, optional.
+    :param depth: how deep below the root directory subdirectories are
+    watched, None for no limit.
+    """
+
+    def __init__(self, path, on_added, on_removed, on_changed=None,
+                 depth=None):
+        self.path = os.path.normpath(path)
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.on_changed = on_changed
+        self.depth = depth
+        self._monitors = {}
+        # directories waiting to be watched and whether watching them
+        # has already been scheduled on the main loop:
+        self._to_watch = deque()
+        self._watch_pending = False
+        self._started = False
+
+    def start(self, dir_paths=None):
+        """
+        Start watching all the directories in the tree. Returns immediately,
+        the tree is walked in a separate thread, unless its directories are
+        given, and they start being watched on the main loop,
+        `WATCH_CHUNK_SIZE` at a time.
+
+        :param dir_paths: optional, paths to all the directories in the tree,
+        i.e. the ones found by a library scanner.
+        """
+        self._started = True
+        if dir_paths is not None:
+            self._schedule([self.path] + list(dir_paths))
+        else:
+            threading.Thread(target=self._list_dirs, daemon=True).start()
+
+    def stop(self):
+        """
+        Stop watching, cancel all the monitors.
+        """
+        self._started = False
+        self._to_watch.clear()
+        for monitor in self._monitors.values():
+            monitor.cancel()
+        self._monitors.clear()
+
+    def _list_dirs(self):
+        dir_paths = [current for current, _subdirs, _files in
+                     self._walk(self.path)]
+        GLib.idle_add(lambda: self._schedule(dir_paths) and False)
+
+    def _schedule(self, dir_paths):
+        if not self._started:
+            return
+        self._to_watch.extend(dir_paths)
+        if not self._watch_pending:
+            self._watch_pending = True
+            GLib.idle_add(self._watch_chunk)
+
+    def _watch_chunk(self):
+        for _ in range(min(WATCH_CHUNK_SIZE, len(self._to_watch))):
+            dir_path = os.path.normpath(self._to_watch.popleft())
+            if self._is_inside(dir_path) and (
+                    self.depth is None or
+                    self._get_depth(dir_path) <= self.depth):
+                self._watch(dir_path)
+        self._watch_pending = bool(self._to_watch)
+        return self._watch_pending
+
+    def _walk(self, path):
+        for current, subdirs, files in os.walk(path):
+            if self.depth is not None and self._get_depth(current) >= self.depth:
+                subdirs.clear()
+            yield current, subdirs, files
+
+    def _get_depth(self, path):
+        relative = os.path.relpath(path, self.path)
+        return 0 if relative == os.curdir else relative.count(os.sep) + 1
+
+    def _watch(self, dir_path):
+        if dir_path in self._monitors:
+            return
+        try:
+            monitor = Gio.File.new_for_path(dir_path).monitor_directory(
+                Gio.FileMonitorFlags.SEND_MOVED, None)
+        except GLib.GError as exc:
+            _LOG.warning(exc)
+            return
+        monitor.connect("changed", self._on_event)
+        self._monitors[dir_path] = monitor
+
+    def _on_event(self, _monitor, gfile, other_gfile, event_type):
+        path = gfile.get_path()
+        if event_type == Gio.FileMonitorEvent.CREATED:
+            self._added(path)
+        elif event_type == Gio.FileMonitorEvent.DELETED:
+            self._removed(path)
+        elif event_type == Gio.FileMonitorEvent.MOVED:
+            self._removed(path)
+            other_path = other_gfile.get_path() if other_gfile else None
+            if other_path and self._is_inside(other_path):
+                self._added(other_path)
+        elif event_type == Gio.FileMonitorEvent.CHANGES_DONE_HINT:
+            if self.on_changed is not None and os.path.isfile(path):
+                self.on_changed(path)
+
+    def _is_inside(self, path):
+        return path == self.path or path.startswith(self.path + os.sep)
+
+    def _added(self, path):
+        if os.path.isdir(path):
+            if self.depth is not None and self._get_depth(path) > self.depth:
+                return
+            for current, _subdirs, files in self._walk(path):
+                self._watch(current)
+                for file_name in files:
+                    self.on_added(os.path.join(current, file_name))
+        elif os.path.isfile(path):
+            self.on_added(path)
+
+    def _removed(self, path):
+        prefix = path + os.sep
+        for dir_path in [dir_path for dir_path in self._monitors if
+                         dir_path == path or dir_path.startswith(prefix)]:
+            self._monitors.pop(dir_path).cancel()
+        self.on_removed(path)
+
+
+class ChangeNotifier:
+    """
+    Container for functions that should be called when something changes.
+    Bound methods are referenced weakly, so that registering does not keep
+    alive the objects, i.e. data sources of the views that are gone.
+    """
+
+    def __init__(self):
+        self._callbacks = []
+
+    def add(self, callback):
+        """
+        Register function to be called on each change.
+
+        :param callback: function or bound method, accepting the
+        arguments given to `notify`.
+        """
+        if hasattr(callback, "__self__"):
+            self._callbacks.append(weakref.WeakMethod(callback))
+        else:
+            self._callbacks.append(lambda: callback)
+
+    def remove(self, callback):
+        """
+        Unregister the given function, if registered.
+
+        :param callback: function or bound method.
+        """
+        self._callbacks = [ref for ref in self._callbacks
+                           if ref() not in (None, callback)]
+
+    def notify(self, *args):
+        """
+        Call all the registered functions, forget the dead ones.
+
+        :param args: arguments passed to the functions.
+        """
+        alive = []
+        for ref in self._callbacks:
+            callback = ref()
+            if callback is not None:
+                alive.append(ref)
+                callback(*args)
+        self._callbacks = alive
@@ -0,0 +1,217 @@
+"""
+Recording and replaying of the gaze samples, so that the behaviour of the
+cursor-style input can be reproduced and benchmarked without a tracker.
+Trace files start with `MAGIC` followed by the samples packed with
+`SAMPLE_FORMAT`, the same as in the binary frames of the tracker server.
+
+Replaying as a tracker, so that the trace can be served by the
+`tracker.TrackerServer`:
+python3 -m pisak.gaze_trace replay TRACE_FILE [--speed SPEED]
+"""
+import sys
+import time
+import struct
+import argparse
+import threading
+
+
+"""
+Format of a single sample: monotonic timestamp in seconds and x, y
+coordinates as fractions of the screen size.
+"""
+SAMPLE_FORMAT = struct.Struct('<dff')
+
+"""
+Header of the trace files.
+"""
+MAGIC = b'PISAKGAZE1\n'
+
+
+def pack_samples(samples):
+    """
+    Pack samples into a contiguous binary block.
+
+    :param samples: list of (timestamp, x, y) tuples.
+
+    :return: bytes.
+    """
+    block = bytearray(SAMPLE_FORMAT.size * len(samples))
+    for idx, sample in enumerate(samples):
+        SAMPLE_FORMAT.pack_into(block, idx * SAMPLE_FORMAT.size, *sample)
+    return bytes(block)
+
+
+def unpack_samples(block):
+    """
+    Unpack samples from a contiguous binary block.
+
+    :param block: bytes-like object, an incomplete sample at the end
+    is ignored.
+
+    :return: list of (timestamp, x, y) tuples.
+    """
+    view = memoryview(block)
+    return list(SAMPLE_FORMAT.iter_unpack(
+        view[:len(view) - len(view) % SAMPLE_FORMAT.size]))
+
+
+class TraceWriter:
+    """
+    Writer of the trace files. Can be used as a context manager.
+
+    :param path: path to the trace file, overwritten if exists.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._lock = threading.Lock()
+
+    def write(self, samples):
+        """
+        Append samples to the trace.
+
+        :param samples: list of (timestamp, x, y) tuples.
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(pack_samples(samples))
+
+    def close(self):
+        """
+        Flush and close the trace file.
+        """
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc_info):
+        self.close()
+
+
+def read_trace(path):
+    """
+    Read a trace file. Besides the binary traces, text files with a sample
+    per line, in a format: 'timestamp x y', are accepted too.
+
+    :param path: path to the trace file.
+
+    :return: list of (timestamp, x, y) tuples.
+    """
+    with open(path, 'rb') as trace_file:
+        data = trace_file.read()
+    if data.startswith(MAGIC):
+        return unpack_samples(memoryview(data)[len(MAGIC):])
+    samples = []
+    for line in data.splitlines():
+        parts = line.split()
+        if len(parts) == 3:
+            samples.append(tuple(float(part) for part in parts))
+    return samples
+
+
+class TraceReplayer:
+    """
+    Replayer of the gaze samples, feeding them to a target in a separate
+    thread, with the original pace, accelerated or as fast as possible.
+    Samples keep their original timestamps, so that anything depending
+    on the intervals between them, i.e. the smoothing filters, behaves
+    the same at any speed.
+
+    :param samples: list of (timestamp, x, y) tuples.
+    :param target: object with the `on_new_samples` method, accepting
+    a list of samples, i.e. `cursor.Sprite`.
+    :param speed: replay speed relative to the original one, 0 for
+    no pauses at all.
+    """
+
+    def __init__(self, samples, target, speed=1.0):
+        self.samples = samples
+        self.target = target
+        self.speed = speed
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._work, daemon=True)
+
+    def start(self):
+        """
+        Start replaying, returns immediately.
+        """
+        self._worker.start()
+
+    def stop(self):
+        """
+        Stop replaying.
+        """
+        self._stopped.set()
+
+    def join(self, timeout=None):
+        """
+        Wait until all the samples have been replayed or replaying
+        has been stopped.
+
+        :param timeout: max number of seconds to wait.
+        """
+        self._worker.join(timeout)
+
+    def _work(self):
+        for sample in pace(self.samples, self.speed, self._stopped):
+            self.target.on_new_samples([sample])
+
+
+def pace(samples, speed=1.0, stopped=None):
+    """
+    Yield samples at the moments matching their timestamps.
+
+    :param samples: list of (timestamp, x, y) tuples.
+    :param speed: pace relative to the original one, 0 for no pauses.
+    :param stopped: optional `threading.Event` that stops yielding.
+
+    :return: generator of the samples.
+    """
+    if not samples:
+        return
+    first = samples[0][0]
+    start = time.monotonic()
+    for sample in samples:
+        if stopped is not None and stopped.is_set():
+            return
+        if speed > 0:
+            delay = start + (sample[0] - first) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        yield sample
+
+
+def replay_to_stdout(samples, speed=1.0):
+    """
+    Replay samples as a tracker does, that is printing the 'gaze_pos' lines
+    on the standard output.
+
+    :param samples: list of (timestamp, x, y) tuples.
+    :param speed: pace relative to the original one, 0 for no pauses.
+    """
+    for _timestamp, x, y in pace(samples, speed):
+        sys.stdout.write('gaze_pos: {} {}\n'.format(x, y))
+        sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gaze traces tools.")
+    subparsers = parser.add_subparsers(dest='command')
+    replay = subparsers.add_parser(
+        'replay', help="replay a trace as a tracker, on the standard output")
+    replay.add_argument('path', help="path to the trace file")
+    replay.add_argument('--speed', type=float, default=1.0,
+                        help="replay speed, 0 for no pauses")
+    args = parser.parse_args(argv)
+    if args.command == 'replay':
+        replay_to_stdout(read_trace(args.path), args.speed)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ Module manages various PISAK input devices and their middlewares.
 import subprocess
 import time
 import os
+import sys
 import threading
 
 import pisak
@@ -107,6 +108,19 @@ INPUTS = {
             "deactivator": "InputGroup.stop_sprite"
         }
     },
+    "eyetracker-replay": {
+        "process": {
+            # list of arguments, the paths may contain spaces:
+            "command": [sys.executable, "-m", "pisak.gaze_trace", "replay",
+                        dirs.HOME_GAZE_TRACE],
+            "server": True
+        },
+        "middleware": {
+            "name": "sprite",
+            "activator": "InputGroup.launch_sprite",
+            "deactivator": "InputGroup.stop_sprite"
+        }
+    },
     "pisak-switch": {
         "process": None,
         "middleware": {
@@ -446,7 +460,8 @@ def run_input_process():
         _LOG.critical(message)
         raise InputsError(message)
     _LOG.debug('Running external process "{}"...'.format(command))
-    process = subprocess.Popen(command.split(), shell=False,
+    args = command if isinstance(command, list) else command.split()
+    process = subprocess.Popen(args, shell=False,
                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     startup = process_spec.get("startup")
     if startup:
@@ -457,6 +472,9 @@ def run_input_process():
         return process, None
     else:
         _LOG.debug("Running tracker server.")
-        device_server = tracker.TrackerServer(process)
+        record_path = dirs.HOME_GAZE_TRACE if \
+            pisak.config.as_bool("record_gaze") and \
+            input_mode != "eyetracker-replay" else None
+        device_server = tracker.TrackerServer(process, record_path=record_path)
         device_server.run()
     return process, device_server
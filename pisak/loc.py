@@ -17,7 +17,8 @@ CONFIG_MAPS = {
         'tobii': 'tobii',
         'eviacam': 'ruchy głowy',
         'eyetracker-no-correction': 'okulograf bez korekcji',
-        'eyetracker-mockup': 'okulograf testowy'},
+        'eyetracker-mockup': 'okulograf testowy',
+        'eyetracker-replay': 'okulograf - odtwarzanie nagrania'},
     'REACT_ON': {
         'press': 'wciśnięcie',
         'release': 'odpuszczenie'},
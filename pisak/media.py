@@ -1,10 +1,11 @@
 """
 Module offering tools for managing and playing different kinds of media data.
 """
-
+import os
+from collections import OrderedDict
 from multiprocessing import Process, Manager, Event
 
-from gi.repository import GObject, ClutterGst, Clutter
+from gi.repository import GObject, GLib, ClutterGst, Clutter
 
 import pisak
 from pisak import res
@@ -98,8 +99,19 @@ class MediaPlayback(Clutter.Actor, MediaPlaybackIface,
     """
     Tool for controlling playback of different kinds of media data,
     being a wrapper of an inernal ClutterMedia.
+
+    Playback can be made gapless and instant: media stream set with
+    `set_next` is queued in the pipeline of the engine just before the
+    current one finishes, so that it follows without any gap, and the
+    `track-changed` signal is emitted when it starts; media streams given
+    to `preload` are loaded in standby engines ahead of time, so that
+    setting any of them as the `filename` is just a swap of the engines.
+    Both require the engine to be created by `_create_engine`.
     """
 
+    # maximum number of media streams loaded in the standby engines.
+    PRELOADED_STREAMS = 2
+
     __gsignals__ = {
         "progressed": (
             GObject.SIGNAL_RUN_FIRST, None,
@@ -109,7 +121,9 @@ class MediaPlayback(Clutter.Actor, MediaPlaybackIface,
         "eos": (
             GObject.SIGNAL_RUN_FIRST, None, ()),
         "limit-declared": (
-            GObject.SIGNAL_RUN_FIRST, None, (GObject.TYPE_FLOAT,))
+            GObject.SIGNAL_RUN_FIRST, None, (GObject.TYPE_FLOAT,)),
+        "track-changed": (
+            GObject.SIGNAL_RUN_FIRST, None, (GObject.TYPE_STRING,))
     }
     __gproperties__ = {
         "rewind_step": (
@@ -129,6 +143,14 @@ class MediaPlayback(Clutter.Actor, MediaPlaybackIface,
     def __init__(self):
         super().__init__()
         self._engine = None
+        self._filename = None
+        self._engine_handlers = []
+        # standby engines with preloaded streams, filename: engine.
+        self._standby = OrderedDict()
+        # stream to be queued gaplessly after the current one:
+        self._next_filename = None
+        # stream that has been queued in the pipeline but not started yet:
+        self._gapless_filename = None
         self.rewind_direction = None
         self.rewind_step = 3
         self.skip_step = 30
@@ -156,11 +178,36 @@ class MediaPlayback(Clutter.Actor, MediaPlaybackIface,
 
         :param value: instance of an engine.
         """
+        for obj, handler in self._engine_handlers:
+            obj.disconnect(handler)
+        self._engine_handlers = []
         self._engine = value
         if value is not None:
-            value.connect("notify::progress", self._on_progressed)
+            self._engine_handlers.append(
+                (value, value.connect("notify::progress", self._on_progressed)))
+            pipeline = self._get_pipeline(value)
+            if pipeline is not None:
+                bus = pipeline.get_bus()
+                self._engine_handlers.extend([
+                    (pipeline, pipeline.connect(
+                        "about-to-finish", self._on_about_to_finish)),
+                    (bus, bus.connect(
+                        "message::stream-start", self._on_stream_start))])
             value.set_audio_volume(self.volume)
 
+    def _create_engine(self):
+        """
+        Create new engine, used for the standby engines.
+
+        :return: engine instance or None if not supported.
+        """
+        return None
+
+    @staticmethod
+    def _get_pipeline(engine):
+        get_pipeline = getattr(engine, "get_pipeline", None)
+        return get_pipeline() if get_pipeline is not None else None
+
     @property
     def rewind_step(self):
         """
@@ -204,16 +251,92 @@ class MediaPlayback(Clutter.Actor, MediaPlaybackIface,
 
     @filename.setter
     def filename(self, value):
+        previous = self._filename
         self._filename = value
+        self._gapless_filename = None
         if value is not None and self.engine is not None:
-            self._engine.set_filename(value)
+            engine = self._standby.pop(value, None)
+            if engine is not None:
+                self._swap_engine(engine, previous)
+            else:
+                self._engine.set_filename(value)
             self._declare_stream_length()
 
+    def set_next(self, filename):
+        """
+        Set media stream that should be played right after the current
+        one finishes, without any gap.
+
+        :param filename: path to the file with media stream or None.
+        """
+        self._next_filename = filename
+
+    def preload(self, filenames):
+        """
+        Load the given media streams in the standby engines, so that
+        switching to any of them is instant. Only the first
+        `PRELOADED_STREAMS` of them are loaded, the previously preloaded
+        streams that are not on the list are dropped.
+
+        :param filenames: list of paths to the files with media streams.
+        """
+        wanted = [name for name in filenames if name and
+                  name != self._filename][:self.PRELOADED_STREAMS]
+        spare = [engine for name, engine in self._standby.items()
+                 if name not in wanted]
+        standby = OrderedDict()
+        for name in wanted:
+            engine = self._standby.get(name)
+            if engine is None:
+                engine = spare.pop() if spare else self._create_engine()
+                if engine is None:
+                    break
+                engine.set_playing(False)
+                engine.set_filename(name)  # prerolls the stream
+            standby[name] = engine
+        for engine in spare:
+            engine.set_playing(False)
+            engine.destroy()
+        self._standby = standby
+
+    def _swap_engine(self, engine, previous):
+        old_engine = self._engine
+        old_engine.set_playing(False)
+        old_engine.set_progress(0)
+        self.engine = engine
+        self.previous_progress = 0
+        if previous:
+            # keep the previous stream loaded, may be used for going back.
+            self._standby[previous] = old_engine
+        else:
+            old_engine.destroy()
+
+    def _on_about_to_finish(self, pipeline):
+        # called from the streaming thread, that's where the next
+        # stream has to be set for the transition to be gapless.
+        filename = self._next_filename
+        if filename:
+            pipeline.set_property(
+                "uri", GLib.filename_to_uri(os.path.abspath(filename), None))
+            self._gapless_filename = filename
+
+    def _on_stream_start(self, _bus, _message):
+        filename = self._gapless_filename
+        if filename is None:
+            return
+        self._gapless_filename = None
+        self._next_filename = None
+        self._filename = filename
+        self.previous_progress = 0
+        self._declare_stream_length()
+        self.emit("track-changed", filename)
+
     def _on_progressed(self, source, event):
         progress = self._engine.get_progress()
         if not progress - self.previous_progress == 1:
             self.emit("progressed", progress, progress * self._engine.get_duration())
-            if progress >= 1:
+            # with the next stream queued the current one never ends:
+            if progress >= 1 and self._gapless_filename is None:
                 self._on_eos()
             self.previous_progress = progress
 
@@ -296,6 +419,9 @@ class MediaPlayback(Clutter.Actor, MediaPlaybackIface,
         Stop playing the media stream and move to the beginning.
         """
         self.stop_rewind()
+        if self._gapless_filename is not None:
+            # drop the next stream already queued in the pipeline.
+            self.filename = self._filename
         self._engine.set_playing(False)
         self._engine.set_progress(0)
 
@@ -378,7 +504,10 @@ class AudioPlayback(MediaPlayback):
 
     def __init__(self):
         super().__init__()
-        self.engine  = ClutterGst.VideoTexture()
+        self.engine = self._create_engine()
+
+    def _create_engine(self):
+        return ClutterGst.VideoTexture()
 
 
 class VideoPlayback(MediaPlayback):
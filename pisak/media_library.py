@@ -3,19 +3,53 @@ Module that creates a model out of the media library stored in the file system.
 Library that will be created has a two-level structure, that is, many different
 categories, each containing many items.
 Module provides also management system for library items marked as favourites.
+Library can be backed by a persistent index, that makes it possible to
+rescan only the directories that have changed since the previous scan and
+keeps the item ids stable between the runs.
 """
-import os.path
+import os
+import json
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import magic
 import configobj
+from sqlalchemy import Table, Column, Integer, String, Float, MetaData, \
+    select, bindparam, create_engine
+from sqlalchemy.exc import SQLAlchemyError
 
-from pisak import res, exceptions, logger
+from pisak import res, exceptions, logger, file_watch, media_search
 
 
 _LOG = logger.get_logger(__name__)
 
 
+"""
+Maximum number of threads scanning the library directories.
+"""
+SCAN_WORKERS = 8
+
+
+_index_metadata = MetaData()
+
+
+_index_directories = Table('directories', _index_metadata,
+        Column('path', String, primary_key=True),
+        Column('parent', String, nullable=True),
+        Column('mtime', Float, nullable=False)
+)
+
+
+_index_items = Table('items', _index_metadata,
+        Column('id', Integer, primary_key=True),
+        Column('path', String, unique=True, nullable=False),
+        Column('directory', String, nullable=False),
+        Column('extra', String, nullable=True),
+        sqlite_autoincrement=True
+)
+
+
 class LibraryException(exceptions.PisakException):
     """
     Exception thrown when the media library met some unexpected condition.
@@ -23,95 +57,172 @@ class LibraryException(exceptions.PisakException):
     pass
 
 
-class Category:
+class _ItemsContainer:
     """
-    Category of items that share some common trait, i.e belong
-    to the same folder etc.
-
-    :param category_id: id number of the category.
-    :param name: name of the category.
+    Base for containers of the library items. Items are kept in the order
+    they were added in and are indexed separately by their ids and by their
+    paths, so that all the lookups and removals take constant time.
     """
 
-    def __init__(self, category_id, name):
-        self.id = category_id
-        self.name = name
-        self._items = []
-        self._dict_items = {}
+    # name of the container used in the log messages.
+    _KIND = 'container'
 
-    def _do_remove_item(self, item):
-        try:
-            self._items.remove(item)
-            self._dict_items.pop(item.path)
-            self._dict_items.pop(item.id)
-        except (ValueError, KeyError):
-            _LOG.warning('No such item in the category: {}.'.format(item))
-    
-    def get_preview_path(self):
-        """
-        Get preview of the category assuming that its items
-        have attribute named 'path'.
+    def __init__(self):
+        self._items = OrderedDict()
+        self._items_by_path = {}
+        self._revision = 0
 
-        :return: path attribute of the first item or None.
+    @property
+    def revision(self):
         """
-        if len(self._items) > 0:
-            return self._items[0].path
-
-    def remove_item(self, item):
+        Number of changes of the items so far, can be used
+        to find out whether something derived from them is outdated.
         """
-        Remove the given item from the category.
+        return self._revision
 
-        :param item: item instance.
+    def get_item_by_id(self, item_id):
         """
-        self._do_remove_item(item)
+        Get item with the given id.
 
-    def remove_item_by_path(self, item_path):
-        """
-        Remove item with the given path from the list of category items.
+        :param item_id: id of the item.
 
-        :param item_path: path attribute of the item.
+        :return: item or None.
         """
         try:
-            self._do_remove_item(self._dict_items[item_path])
+            return self._items[item_id]
         except KeyError:
-            _LOG.warning('No such item in the category: {}.'.format(item_path))
+            _LOG.warning('No such item in the {}: {}.'.format(
+                self._KIND, item_id))
 
     def get_item_by_path(self, item_path):
         """
-        Get item with the given path from the list of category items.
+        Get item with the given path.
 
         :param item_path: path attribute of the item.
 
         :return: item or None.
         """
         try:
-            return self._dict_items[item_path]
+            return self._items_by_path[item_path]
         except KeyError:
-            _LOG.warning('No such item in the category: {}.'.format(item_path))
+            _LOG.warning('No such item in the {}: {}.'.format(
+                self._KIND, item_path))
+
+    def has_item(self, item_path):
+        """
+        Check if there is an item with the given path.
+
+        :param item_path: path attribute of the item.
+
+        :return: boolean.
+        """
+        return item_path in self._items_by_path
 
     def append_item(self, item):
         """
-        Add item to the category.
+        Add item.
+
+        :param item: item instance.
+        """
+        self._items[item.id] = item
+        self._items_by_path[item.path] = item
+        self._revision += 1
+
+    def extend_items(self, items):
+        """
+        Add many items at once.
+
+        :param items: iterable of item instances.
+        """
+        for item in items:
+            self._items[item.id] = item
+            self._items_by_path[item.path] = item
+        self._revision += 1
+
+    def remove_item(self, item):
+        """
+        Remove the given item.
 
         :param item: item instance.
         """
-        self._items.append(item)
-        self._dict_items[item.path] = item
-        self._dict_items[item.id] = item
+        try:
+            del self._items[item.id]
+            del self._items_by_path[item.path]
+            self._revision += 1
+        except KeyError:
+            _LOG.warning('No such item in the {}: {}.'.format(
+                self._KIND, item))
+
+    def remove_item_by_path(self, item_path):
+        """
+        Remove item with the given path.
+
+        :param item_path: path attribute of the item.
+        """
+        try:
+            item = self._items_by_path.pop(item_path)
+            del self._items[item.id]
+            self._revision += 1
+        except KeyError:
+            _LOG.warning('No such item in the {}: {}.'.format(
+                self._KIND, item_path))
+
+    def remove_items(self, items):
+        """
+        Remove many items at once. Items that are not there are skipped.
+
+        :param items: iterable of item instances.
+        """
+        for item in items:
+            if self._items_by_path.get(item.path) is item:
+                del self._items_by_path[item.path]
+                self._items.pop(item.id, None)
+        self._revision += 1
 
     def clear(self):
         """
-        Clear the whole category, remove all the items.
+        Clear the whole container, remove all the items.
         """
         self._items.clear()
-        self._dict_items.clear()
+        self._items_by_path.clear()
+        self._revision += 1
 
     def get_all_items(self):
         """
-        Get all items from the category.
+        Get all items, in the order they were added in.
 
         :return: list of items.
         """
-        return self._items
+        return list(self._items.values())
+
+
+class Category(_ItemsContainer):
+    """
+    Category of items that share some common trait, i.e belong
+    to the same folder etc.
+
+    :param category_id: id number of the category.
+    :param name: name of the category.
+    :param path: path to the folder corresponding to the category, if any.
+    """
+
+    _KIND = 'category'
+
+    def __init__(self, category_id, name, path=None):
+        super().__init__()
+        self.id = category_id
+        self.name = name
+        self.path = path
+
+    def get_preview_path(self):
+        """
+        Get preview of the category assuming that its items
+        have attribute named 'path'.
+
+        :return: path attribute of the first item or None.
+        """
+        for item in self._items.values():
+            return item.path
 
 
 '''Single item from the media library.
@@ -192,7 +303,7 @@ class FavouritesStore:
         return path in self.get_all()
 
 
-class Library:
+class Library(_ItemsContainer):
     """
     Library store. Contains lists with categories and items.
 
@@ -206,24 +317,45 @@ class Library:
     may be displayed to user.
     :param exec_for_all: callable that will be executed for each item found
     while scanning the file system.
+    :param index_path: path to the database file with the library index,
+    if None then the whole file system is scanned each time.
     """
+
+    _KIND = 'library'
+
     def __init__(self, path, accepted_types, favs_store_path=None,
-                 favs_alias=None, exec_for_all=None):
+                 favs_alias=None, exec_for_all=None, index_path=None):
+        super().__init__()
         self.path = path
         self.accepted_types = accepted_types
         self.favs_store_path = favs_store_path
         self.favs_alias = favs_alias
         self.exec_for_all = exec_for_all
+        self.index_path = index_path
         self.favs_store = None
         self._categories = []
-        self._items = []
-        self._dict_items = {}
+        # ids are never reused, next one is greater than any id so far.
+        self._next_item_id = 0
         self._dict_categories = {}
+        self._dict_folder_categories = {}
+        self._watcher = None
+        # persistent index of the library, if any:
+        self._index = None
+        # paths to all the directories found by the last scan:
+        self._dir_paths = []
+        self._search_index = None
+        # functions to be called when the library content changes.
+        self.on_change = file_watch.ChangeNotifier()
         self._scan()
 
     def _scan(self):
-        scanner = _Scanner(self)
+        if self.index_path is not None:
+            self._index = LibraryIndex(self.index_path)
+            scanner = _IndexedScanner(self, self._index)
+        else:
+            scanner = _Scanner(self)
         scanner.scan()
+        self._dir_paths = scanner.dir_paths
 
     def include_favs(self):
         """
@@ -240,10 +372,7 @@ class Library:
                 category = Category(-1, self.favs_alias)
                 self.insert_category(0, category)
             category.clear()
-            for item in favs:
-                item = self.get_item_by_path(item)
-                if item:
-                    category.append_item(item)
+            category.extend_items(filter(None, map(self.get_item_by_path, favs)))
             if len(category.get_all_items()) == 0:
                 self.remove_category(category)
 
@@ -261,7 +390,7 @@ class Library:
         if not category:
             category = Category(-1, self.favs_alias)
             self.insert_category(0, category)
-        if not category.get_item_by_path(path):
+        if not category.has_item(path):
             item = self.get_item_by_path(path)
             if item:
                 category.append_item(item)
@@ -287,10 +416,8 @@ class Library:
             return
         self.favs_store.remove(path)
         category = self.get_category_by_id(-1)
-        if category:
-            item = category.get_item_by_path(path)
-            if item:
-                category.remove_item(item)
+        if category and category.has_item(path):
+            category.remove_item_by_path(path)
 
     def get_category_by_id(self, category_id):
         """
@@ -305,68 +432,36 @@ class Library:
         except KeyError:
             _LOG.warning('No such category in the library: {}.'.format(category_id))
 
-    def get_item_by_id(self, item_id):
-        """
-        Get item with the given index.
-
-        :param item_id: index of the item.
-
-        :returns: item or None.
-        """
-        try:
-            return self._dict_items[item_id]
-        except KeyError:
-            _LOG.warning('No such item in the library: {}.'.format(item_id))
-
-    def get_item_by_path(self, item_path):
+    def append_item(self, item):
         """
-        Get item with the given path.
-
-        :param item_path: path of the item.
+        Add item to the library.
 
-        :returns: item or None.
+        :param item: item instance.
         """
-        try:
-            return self._dict_items[item_path]
-        except KeyError:
-            _LOG.warning('No such item in the library: {}.'.format(item_path))
+        super().append_item(item)
+        self._next_item_id = max(self._next_item_id, item.id + 1)
 
-    def remove_item_by_path(self, item_path):
+    def extend_items(self, items):
         """
-        Remove item with the given path.
+        Add many items to the library at once.
 
-        :param item_path: path of the item.
+        :param items: iterable of item instances.
         """
-        try:
-            item = self._dict_items[item_path]
-            self._items.remove(item)
-            self._dict_items.pop(item_path)
-            self._dict_items.pop(item.id)
-        except (ValueError, KeyError):
-            _LOG.warning('No such item in the library: {}.'.format(item_path))
-
-    def append_item(self, item):
-        """
-        Add item to the library.
-
-        :param item: item instance.
-        """
-        self._items.append(item)
-        self._dict_items[item.path] = item
-        self._dict_items[item.id] = item
+        items = list(items)
+        super().extend_items(items)
+        if items:
+            self._next_item_id = max(
+                self._next_item_id, max(item.id for item in items) + 1)
 
     def get_id_for_new_item(self):
         """
         Get id for new item to be inserted to the library.
 
-        :return: new id calculated in such a way that ids
-        of all the items in the library are sorted in an
-        ascendant order and then the highest value id + 1 is
-        returned as the id. Ids start from 0.
+        :return: id greater than the id of any item that has ever
+        been added to the library, so that ids are never reused.
+        Ids start from 0.
         """
-        return (max([key for key in self._dict_items if
-                isinstance(key, int)]) + 1) if \
-            len(self._dict_items) > 0 else 0
+        return self._next_item_id
 
     def append_category(self, category):
         """
@@ -376,6 +471,8 @@ class Library:
         """
         self._categories.append(category)
         self._dict_categories[category.id] = category
+        if category.path is not None:
+            self._dict_folder_categories[category.path] = category
 
     def insert_category(self, idx, category):
         """
@@ -386,6 +483,8 @@ class Library:
         """
         self._categories.insert(idx, category)
         self._dict_categories[category.id] = category
+        if category.path is not None:
+            self._dict_folder_categories[category.path] = category
 
     def remove_category(self, category):
         """
@@ -396,17 +495,10 @@ class Library:
         try:
             self._categories.remove(category)
             self._dict_categories.pop(category.id)
+            self._dict_folder_categories.pop(category.path, None)
         except (ValueError, KeyError):
             _LOG.warning('No such category in the library: {}.'.format(category))
 
-    def get_all_items(self):
-        """
-        Get all items from the library.
-
-        :return: list of items.
-        """
-        return self._items
-
     def get_all_categories(self):
         """
         Get all categories from the library.
@@ -415,16 +507,146 @@ class Library:
         """
         return self._categories
 
+    def search(self, query, limit=media_search.RESULTS_LIMIT):
+        """
+        Find items whose names or names of whose categories contain
+        words starting with the given words, i.e. 'wak mor' finds
+        'Wakacje nad morzem'. Search index is built on the first use.
+
+        :param query: text typed in by the user.
+        :param limit: maximum number of the results.
+
+        :return: list of items, the best matches first.
+        """
+        return [self._items[item_id] for item_id in
+                self._get_search_index().search(query, limit)
+                if item_id in self._items]
+
+    def search_categories(self, query, limit=media_search.RESULTS_LIMIT):
+        """
+        Find categories whose names contain words starting
+        with the given words.
+
+        :param query: text typed in by the user.
+        :param limit: maximum number of the results.
+
+        :return: list of categories, the best matches first.
+        """
+        return [self._dict_categories[category_id] for category_id in
+                self._get_search_index().search_categories(query, limit)
+                if category_id in self._dict_categories]
+
+    def _get_search_index(self):
+        if self._search_index is None:
+            self._search_index = media_search.LibrarySearchIndex(self)
+        return self._search_index
+
+    def watch(self):
+        """
+        Start watching the library directory and keep the library up to date
+        with any files added or removed in the meantime, without rescanning.
+        Functions registered with `on_change` are called after each update.
+        Folders that become empty are kept as empty categories, so that
+        the ids of the other categories do not change. Directories found
+        by the scan are watched, the tree is not walked again.
+        """
+        if self._watcher is None:
+            self._watcher = file_watch.DirectoryWatcher(
+                self.path, self._on_file_added, self._on_file_removed)
+            self._watcher.start(self._dir_paths)
+
+    def stop_watching(self):
+        """
+        Stop watching the library directory.
+        """
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def _on_file_added(self, path):
+        if os.path.splitext(path)[-1].lower() not in self.accepted_types or \
+                self.has_item(path):
+            return
+        folder_path = os.path.dirname(path)
+        category = self._dict_folder_categories.get(folder_path)
+        if category is None:
+            category = Category(
+                max([cat.id for cat in self._categories] + [-1]) + 1,
+                _generate_category_name(self.path, folder_path), folder_path)
+            self.append_category(category)
+        item = Item(None, path, {})
+        if self.exec_for_all is not None:
+            try:
+                files = os.listdir(folder_path)
+            except OSError:
+                files = []
+            self.exec_for_all(category, item, path, folder_path,
+                              os.path.split(folder_path)[-1], files)
+        item = item._replace(id=self._store_new_item(folder_path, item))
+        category.append_item(item)
+        self.append_item(item)
+        self.on_change.notify()
+
+    def _on_file_removed(self, path):
+        prefix = path + os.sep
+        if self.has_item(path):
+            removed = [self._items_by_path[path]]
+        else:
+            removed = [item for item in self._items.values() if
+                       item.path.startswith(prefix)]
+        if not removed:
+            return
+        favs = self._dict_categories.get(-1)
+        if favs is not None:
+            favs.remove_items(removed)
+        for item in removed:
+            category = self._dict_folder_categories.get(
+                os.path.dirname(item.path))
+            if category is not None:
+                category.remove_items([item])
+        self.remove_items(removed)
+        if self._index is not None:
+            self._index.update({}, [], {}, [item.id for item in removed])
+        self.on_change.notify()
+
+    def _store_new_item(self, folder_path, item):
+        """
+        Store item added while watching in the index, so that it keeps its id
+        and is not taken for a new one by the next scan.
+
+        :param folder_path: path to the folder containing the item.
+        :param item: item without an id.
+
+        :return: id for the item, from the index if it could be stored there.
+        """
+        if self._index is not None:
+            item_id = self._index.update(
+                {}, [], {folder_path: [item]}, []).get(item.path)
+            if item_id is not None:
+                return item_id
+        return self.get_id_for_new_item()
+
 
 class _Scanner:
     """
-    Library scanner. Scans directories using :func:`os.walk`.
+    Library scanner. Scans directories using :func:`os.scandir`, in
+    a bounded pool of threads, one directory per task. Results are then
+    merged into the library in order of the directory paths, so that
+    they do not depend on the order in which the tasks have finished.
+
+    :param library: library instance.
+    :param workers: maximum number of threads scanning the directories,
+    if None then `SCAN_WORKERS` is used.
     """
 
-    def __init__(self, library):
+    def __init__(self, library, workers=None):
         self.library = library
+        self.workers = workers or SCAN_WORKERS
         self.magic = magic.open(magic.MIME_TYPE | magic.SYMLINK)
         self.magic.load()
+        self._accepted_types = set(library.accepted_types)
+        # paths to all the directories visited by the last walk:
+        self.dir_paths = []
 
     def get_item_paths(self):
         """
@@ -440,37 +662,346 @@ class _Scanner:
         """
         next_cat_id = 0
         next_item_id = 0
-        for current, _subdirs, files in os.walk(self.library.path):
+        for current, (_subdirs, files) in self._walk(self._visit):
             if current.startswith('.'):
                 continue
             category_name = self._generate_category_name(current)
-            new_category = Category(next_cat_id, category_name)
+            new_category = Category(next_cat_id, category_name, current)
             for file in files:
-                item_path = os.path.join(current, file)
-                if not self._test_file_ext(item_path):
+                if not self._test_name_ext(file):
                     continue
+                item_path = os.path.join(current, file)
                 new_item = Item(next_item_id, item_path, {})
                 if self.library.exec_for_all is not None:
                     self.library.exec_for_all(
                         new_category, new_item, item_path,
                         current, os.path.split(current)[-1], files)
                 new_category.append_item(new_item)
-                self.library.append_item(new_item)
                 next_item_id += 1
-            if len(new_category.get_all_items()) > 0:
+            items = new_category.get_all_items()
+            if items:
+                self.library.extend_items(items)
                 self.library.append_category(new_category)
                 next_cat_id += 1
 
+    def _visit(self, current, _parent):
+        """
+        Visit a single directory, called in a worker thread.
+
+        :return: tuple with a result for the directory and
+        a list of subdirectories that should be visited next.
+        """
+        subdirs, files = self._list_directory(current)
+        return (subdirs, files), subdirs
+
+    def _walk(self, visit):
+        """
+        Walk the library directory tree. Each directory is visited in
+        a worker thread, as soon as its parent has been visited.
+
+        :param visit: function called with a directory path and its parent
+        path, returning a result for the directory and a list of
+        subdirectories paths.
+
+        :return: list of tuples with directory paths and results of their
+        visits, sorted by the paths.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {pool.submit(self._visit_task, visit,
+                                   self.library.path, None)}
+            while pending:
+                done, pending = futures.wait(
+                    pending, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    current, result, subdirs = future.result()
+                    if result is None:
+                        continue
+                    results[current] = result
+                    pending.update(pool.submit(self._visit_task, visit,
+                                               subdir, current)
+                                   for subdir in subdirs)
+        self.dir_paths = sorted(results)
+        return sorted(results.items(), key=lambda entry: entry[0])
+
+    @staticmethod
+    def _visit_task(visit, current, parent):
+        try:
+            result, subdirs = visit(current, parent)
+        except OSError as exc:
+            _LOG.warning(exc)
+            result, subdirs = None, []
+        return current, result, subdirs
+
+    @staticmethod
+    def _list_directory(current):
+        """
+        List the directory contents. Symbolic links to directories are
+        neither followed nor treated as files, as in :func:`os.walk`.
+
+        :param current: path to the directory.
+
+        :return: tuple with a list of subdirectories paths and
+        a sorted list of file names.
+        """
+        subdirs, files = [], []
+        for entry in os.scandir(current):
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirs.append(entry.path)
+            else:
+                files.append(entry.name)
+        files.sort()
+        return subdirs, files
+
     def _generate_category_name(self, path):
-        if path == self.library.path:
-            return os.path.split(path)[1]
-        else:        
-            return path.partition(self.library.path)[2][1:]
+        return _generate_category_name(self.library.path, path)
     
     def _test_file_magic(self, path):
         file_type = self.magic.file(path)
         return file_type in self.library.accepted_types
 
     def _test_file_ext(self, path):
-        return os.path.splitext(path)[-1].lower() in self.library.accepted_types
+        return os.path.splitext(path)[-1].lower() in self._accepted_types
+
+    def _test_name_ext(self, name):
+        return os.path.splitext(name)[-1].lower() in self._accepted_types
+
 
+class LibraryIndex:
+    """
+    Persistent index of the library, stored in an SQLite database.
+    Keeps record of all the scanned directories, together with their
+    modification times, and of all the items found in them.
+
+    :param db_path: path to the database file.
+    """
+
+    def __init__(self, db_path):
+        self._engine = create_engine('sqlite:///' + db_path)
+        _index_metadata.create_all(self._engine)
+
+    def load(self):
+        """
+        Load the whole index.
+
+        :return: tuple with a dictionary of directories, each being a tuple
+        with a parent directory path and a modification time, and
+        a dictionary of lists of items, both keyed by directory paths.
+        """
+        directories, items = {}, {}
+        try:
+            with self._engine.connect() as conn:
+                for row in conn.execute(select([_index_directories])):
+                    directories[row['path']] = (row['parent'], row['mtime'])
+                for row in conn.execute(select([_index_items])):
+                    items.setdefault(row['directory'], []).append(
+                        Item(row['id'], row['path'],
+                             json.loads(row['extra'] or '{}')))
+        except SQLAlchemyError as exc:
+            _LOG.error(exc)
+        return directories, items
+
+    def update(self, directories, removed_directories, items,
+               removed_items):
+        """
+        Write all the changes to the index, in a single transaction.
+
+        :param directories: dictionary of new or changed directories, each
+        being a tuple with a parent directory path and a modification time.
+        :param removed_directories: list of paths to the removed directories.
+        :param items: dictionary of lists of items from the new or changed
+        directories, keyed by directory paths. Items without ids
+        are inserted and they get their ids assigned.
+        :param removed_items: list of ids of the removed items.
+
+        :return: dictionary of the new items ids, keyed by item paths.
+        """
+        new_items = [{'path': item.path, 'directory': directory,
+                      'extra': json.dumps(item.extra)}
+                     for directory, dir_items in items.items()
+                     for item in dir_items if item.id is None]
+        old_items = [{'item_id': item.id, 'extra': json.dumps(item.extra)}
+                     for dir_items in items.values()
+                     for item in dir_items if item.id is not None]
+        new_ids = {}
+        try:
+            with self._engine.begin() as conn:
+                for chunk in _chunks(list(directories) +
+                                     list(removed_directories)):
+                    conn.execute(_index_directories.delete().where(
+                        _index_directories.c.path.in_(chunk)))
+                if directories:
+                    conn.execute(_index_directories.insert(), [
+                        {'path': path, 'parent': parent, 'mtime': mtime}
+                        for path, (parent, mtime) in directories.items()])
+                for chunk in _chunks(removed_items):
+                    conn.execute(_index_items.delete().where(
+                        _index_items.c.id.in_(chunk)))
+                if old_items:
+                    conn.execute(_index_items.update().where(
+                        _index_items.c.id == bindparam('item_id')).values(
+                        extra=bindparam('extra')), old_items)
+                if new_items:
+                    conn.execute(_index_items.insert(), new_items)
+                    for chunk in _chunks([row['path'] for row in new_items]):
+                        new_ids.update(
+                            (row['path'], row['id']) for row in conn.execute(
+                                select([_index_items.c.id,
+                                        _index_items.c.path]).where(
+                                    _index_items.c.path.in_(chunk))))
+        except SQLAlchemyError as exc:
+            _LOG.error(exc)
+        return new_ids
+
+
+def _generate_category_name(library_path, path):
+    """
+    Generate name of the category corresponding to the given folder.
+
+    :param library_path: path to the library directory.
+    :param path: path to the folder.
+
+    :return: name of the category.
+    """
+    if path == library_path:
+        return os.path.split(path)[1]
+    else:
+        return path.partition(library_path)[2][1:]
+
+
+def _chunks(sequence, size=500):
+    """
+    Split the given sequence into chunks, small enough to be passed
+    as parameters of a single SQLite statement.
+    """
+    return [sequence[idx : idx+size] for idx in range(0, len(sequence), size)]
+
+
+class _IndexedScanner(_Scanner):
+    """
+    Library scanner backed by a persistent index. Directories whose
+    modification time has not changed since the previous scan are restored
+    from the index, without being listed, so the cost of a scan depends on
+    the number of directories and on the amount of changes rather than on
+    the library size. Items keep their ids between the scans, categories
+    are numbered in order of their paths.
+
+    :param library: library instance.
+    :param index: :class:`LibraryIndex` instance.
+    """
+
+    def __init__(self, library, index):
+        super().__init__(library)
+        self.index = index
+
+    def scan(self):
+        """
+        Scan the library directory, list only the directories that have
+        changed and update the index.
+        """
+        known_dirs, known_items = self.index.load()
+        children = {}
+        for path, (parent, _mtime) in known_dirs.items():
+            children.setdefault(parent, []).append(path)
+
+        def visit(current, parent):
+            mtime = os.stat(current).st_mtime
+            if known_dirs.get(current) == (parent, mtime):
+                return (parent, mtime, None), children.get(current, [])
+            subdirs, files = self._list_directory(current)
+            return (parent, mtime, files), subdirs
+
+        changed_dirs, changed_items, removed_ids = {}, {}, []
+        folders = []
+        for current, (parent, mtime, files) in self._walk(visit):
+            if files is None:
+                dir_items = known_items.get(current, [])
+            else:
+                dir_items, removed = self._collect_items(
+                    current, files, known_items.get(current, []))
+                changed_dirs[current] = (parent, mtime)
+                changed_items[current] = dir_items
+                removed_ids.extend(removed)
+            folders.append((current, dir_items))
+
+        seen_dirs = set(current for current, _dir_items in folders)
+        removed_dirs = [path for path in known_dirs if path not in seen_dirs]
+        for path in removed_dirs:
+            removed_ids.extend(item.id for item in known_items.get(path, []))
+        new_ids = self.index.update(changed_dirs, removed_dirs,
+                                    changed_items, removed_ids)
+        new_ids.update(self._get_temporary_ids(folders, new_ids))
+
+        next_cat_id = 0
+        for current, dir_items in folders:
+            if not dir_items:
+                continue
+            category = Category(next_cat_id, self._generate_category_name(current),
+                                current)
+            category.extend_items(self._assign_ids(
+                sorted(dir_items, key=lambda item: item.path), new_ids))
+            self.library.extend_items(category.get_all_items())
+            self.library.append_category(category)
+            next_cat_id += 1
+
+    @staticmethod
+    def _get_temporary_ids(folders, new_ids):
+        """
+        Get in-memory ids for the new items that could not be stored
+        in the index, so that they are in the library anyway.
+
+        :param folders: list of tuples with directory paths and
+        lists of their items.
+        :param new_ids: dictionary of the ids assigned by the index,
+        keyed by item paths.
+
+        :return: dictionary of the temporary ids, keyed by item paths.
+        """
+        missing = sorted(item.path for _current, dir_items in folders
+                         for item in dir_items
+                         if item.id is None and item.path not in new_ids)
+        if not missing:
+            return {}
+        _LOG.error("{} items could not be stored in the library index, "
+                   "they get temporary ids.".format(len(missing)))
+        next_id = max([item.id for _current, dir_items in folders
+                       for item in dir_items if item.id is not None] +
+                      list(new_ids.values()) + [-1]) + 1
+        return {path: next_id + idx for idx, path in enumerate(missing)}
+
+    @staticmethod
+    def _assign_ids(items, new_ids):
+        for item in items:
+            if item.id is None:
+                item = item._replace(id=new_ids[item.path])
+            yield item
+
+    def _collect_items(self, current, files, previous_items):
+        """
+        Collect items from the listed directory and compare them
+        with the items that were previously found there.
+
+        :param current: path to the directory.
+        :param files: list of names of the files in the directory.
+        :param previous_items: list of the previously found items.
+
+        :return: tuple with a list of items, without ids for the new
+        ones, and a list of ids of the items that have been removed.
+        """
+        previous = {item.path: item for item in previous_items}
+        category = Category(None, self._generate_category_name(current),
+                            current)
+        dir_items = []
+        for file in files:
+            if not self._test_name_ext(file):
+                continue
+            item_path = os.path.join(current, file)
+            old_item = previous.pop(item_path, None)
+            item = Item(old_item.id if old_item else None, item_path, {})
+            if self.library.exec_for_all is not None:
+                self.library.exec_for_all(
+                    category, item, item_path,
+                    current, os.path.split(current)[-1], files)
+            dir_items.append(item)
+        return dir_items, [item.id for item in previous.values()]
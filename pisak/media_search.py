@@ -0,0 +1,208 @@
+"""
+Full-text search over the media libraries, based on the SQLite FTS5
+extension. Queries are matched against prefixes of the words, so that
+results can be refreshed after each single letter typed in, i.e. by
+a speller-style input. Diacritics are ignored, both in the indexed
+names and in the queries.
+"""
+import os
+import re
+import sqlite3
+import threading
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import StaticPool
+
+from pisak import logger
+
+
+_LOG = logger.get_logger(__name__)
+
+
+"""
+Tokenizer of all the full-text indexes. Diacritics are removed from all
+the letters only by SQLite 3.27 and newer, older ones leave them
+on the letters with more than one diacritic, which is fine for
+the Polish ones.
+"""
+TOKENIZER = "unicode61 remove_diacritics {}".format(
+    2 if sqlite3.sqlite_version_info >= (3, 27, 0) else 1)
+
+"""
+Letters that the tokenizer does not fold, being distinct letters rather
+than ones with diacritics, and their replacements. They are replaced both
+in the indexed texts and in the queries.
+"""
+FOLDED_LETTERS = {"ł": "l", "Ł": "L"}
+
+_FOLDING_TABLE = str.maketrans(FOLDED_LETTERS)
+
+"""
+Lengths of the prefixes that are indexed separately,
+so that queries with short prefixes are fast too.
+"""
+PREFIXES = "1 2 3"
+
+"""
+Default maximum number of the search results.
+"""
+RESULTS_LIMIT = 50
+
+
+def make_prefix_query(query):
+    """
+    Turn text typed in by the user into an FTS5 query that matches
+    entries containing words starting with each of the given words.
+
+    :param query: text typed in by the user.
+
+    :return: FTS5 query string or None if there are no words in the text.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join('"{}"*'.format(fold(word)) for word in words)
+
+
+def fold(value):
+    """
+    Replace the `FOLDED_LETTERS` in the text.
+
+    :param value: text.
+
+    :return: text without the folded letters.
+    """
+    return value.translate(_FOLDING_TABLE)
+
+
+def fold_sql(expression):
+    """
+    Wrap SQL expression in an expression replacing the `FOLDED_LETTERS`,
+    for the texts indexed by SQLite itself, i.e. from the triggers.
+
+    :param expression: SQL expression evaluating to a text.
+
+    :return: SQL expression.
+    """
+    for letter, replacement in sorted(FOLDED_LETTERS.items()):
+        expression = "replace({}, '{}', '{}')".format(
+            expression, letter, replacement)
+    return expression
+
+
+class LibrarySearchIndex:
+    """
+    In-memory full-text index over the names of the items of a media
+    library and the names of their categories. Index is brought up to date
+    with the library lazily, just before a search, and only the categories
+    that have changed since the previous search are reindexed.
+    Items from the favourites category are indexed with their
+    original categories only.
+
+    :param library: library instance.
+    """
+
+    def __init__(self, library):
+        self.library = library
+        self._lock = threading.Lock()
+        # indexed categories, category id:
+        # (revision, category name, {item id: item name}).
+        self._categories = {}
+        self._engine = create_engine(
+            "sqlite://", poolclass=StaticPool,
+            connect_args={"check_same_thread": False})
+        try:
+            self._engine.execute(text(
+                "CREATE VIRTUAL TABLE entries USING fts5("
+                "name, category, category_id UNINDEXED, "
+                "tokenize='{}', prefix='{}')".format(TOKENIZER, PREFIXES)))
+            self._available = True
+        except SQLAlchemyError as exc:
+            _LOG.warning("Search index is not available: {}.".format(exc))
+            self._available = False
+
+    def search(self, query, limit=RESULTS_LIMIT):
+        """
+        Find items whose names or names of whose categories
+        contain words starting with the given words.
+
+        :param query: text typed in by the user.
+        :param limit: maximum number of the results.
+
+        :return: list of ids of the items, the best matches first.
+        """
+        rows = self._query(
+            "SELECT rowid FROM entries WHERE entries MATCH :match "
+            "ORDER BY rank LIMIT :limit", query, limit)
+        return [row[0] for row in rows]
+
+    def search_categories(self, query, limit=RESULTS_LIMIT):
+        """
+        Find categories whose names contain words starting
+        with the given words.
+
+        :param query: text typed in by the user.
+        :param limit: maximum number of the results.
+
+        :return: list of ids of the categories, the best matches first.
+        """
+        rows = self._query(
+            "SELECT category_id, min(rank) AS best FROM entries "
+            "WHERE entries MATCH :match GROUP BY category_id "
+            "ORDER BY best LIMIT :limit", query, limit, column="category")
+        return [row[0] for row in rows]
+
+    def _query(self, statement, query, limit, column=None):
+        match = make_prefix_query(query)
+        if not match or not self._available:
+            return []
+        if column is not None:
+            match = "{} : ({})".format(column, match)
+        with self._lock:
+            self._sync()
+            try:
+                return self._engine.execute(
+                    text(statement), match=match, limit=limit).fetchall()
+            except SQLAlchemyError as exc:
+                _LOG.error(exc)
+                return []
+
+    def _sync(self):
+        removed, added, categories = [], [], {}
+        for category in self.library.get_all_categories():
+            if category.id == -1:
+                continue  # favourites
+            indexed = self._categories.pop(category.id, None)
+            if indexed is not None and \
+                    indexed[:2] == (category.revision, category.name):
+                categories[category.id] = indexed
+                continue
+            old_items = indexed[2] if indexed is not None else {}
+            items = {item.id: os.path.splitext(os.path.basename(item.path))[0]
+                     for item in category.get_all_items()}
+            renamed = indexed is not None and indexed[1] != category.name
+            removed.extend(
+                {"item_id": item_id} for item_id, name in old_items.items()
+                if renamed or items.get(item_id) != name)
+            added.extend(
+                {"item_id": item_id, "name": fold(name),
+                 "category": fold(category.name), "category_id": category.id}
+                for item_id, name in items.items()
+                if renamed or old_items.get(item_id) != name)
+            categories[category.id] = (category.revision, category.name, items)
+        # whatever is left has been removed from the library:
+        for _revision, _name, items in self._categories.values():
+            removed.extend({"item_id": item_id} for item_id in items)
+        self._categories = categories
+        if not removed and not added:
+            return
+        with self._engine.begin() as conn:
+            if removed:
+                conn.execute(text(
+                    "DELETE FROM entries WHERE rowid = :item_id"), removed)
+            if added:
+                conn.execute(text(
+                    "INSERT INTO entries (rowid, name, category, category_id) "
+                    "VALUES (:item_id, :name, :category, :category_id)"),
+                    added)
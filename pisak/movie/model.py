@@ -31,6 +31,9 @@ FAVOURITE_MOVIES_STORE = os.path.join(dirs.HOME_PISAK_FAVOURITES, "favourite_mov
 FAVOURITE_MOVIES_ALIAS = "ULUBIONE"
 
 
+LIBRARY_INDEX = os.path.join(dirs.HOME_PISAK_DATABASES, "movie_library.db")
+
+
 FAKE_COVER_NAME = "fake_cover.png"
 
 
@@ -144,7 +147,9 @@ def get_library():
         library = _LIBRARY_STORE[LIBRARY_DIR]
     except KeyError:
         library = _Library(
-            LIBRARY_DIR, ACCEPTED_TYPES, FAVOURITE_MOVIES_STORE, FAVOURITE_MOVIES_ALIAS)
+            LIBRARY_DIR, ACCEPTED_TYPES, FAVOURITE_MOVIES_STORE, FAVOURITE_MOVIES_ALIAS,
+            index_path=LIBRARY_INDEX)
         library.include_favs()
+        library.watch()
         _LIBRARY_STORE[LIBRARY_DIR] = library
     return library
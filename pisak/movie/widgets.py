@@ -20,6 +20,11 @@ class FlatSource(pager.DataSource):
 
     def __init__(self):
         super().__init__()
+        library = model.get_library()
+        self._on_library_change()
+        library.on_change.add(self._on_library_change)
+
+    def _on_library_change(self):
         self.data = sorted(list(model.get_library().get_all_items()),
                            key=lambda movie: os.path.basename(movie.path))
 
@@ -47,7 +52,7 @@ class FlatSource(pager.DataSource):
 
     def _do_set_preview(self, tile, preview_path):
         if os.path.isfile(preview_path):
-            tile.preview_path = preview_path
+            tile.load_preview(preview_path)
             return False
         else:
             return True
@@ -2,12 +2,13 @@
 Basic implementation of sliding page widget.
 """
 import threading
-import itertools
+import heapq
+from bisect import bisect_left, bisect_right
 from math import ceil
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from functools import total_ordering
 
-from gi.repository import Clutter, GObject
+from gi.repository import Clutter, GObject, GLib
 
 import pisak
 from pisak import res, logger, exceptions, properties, scanning, layout, \
@@ -17,6 +18,13 @@ from pisak import res, logger, exceptions, properties, scanning, layout, \
 _LOG = logger.get_logger(__name__)
 
 
+"""
+Number of the latest changes of the `data` buffer that are remembered,
+pages built before any older change are considered outdated.
+"""
+CHANGES_LOG_LENGTH = 256
+
+
 @total_ordering
 class DataItem:
     """
@@ -59,12 +67,24 @@ class LazyWorker:
         self._worker = None
         self._running = True
 
+        # synchronization for an access to the queue of pending portions.
+        self._queue_lock = threading.Lock()
+        # heap of (priority, index) pairs, each index pointing to the first
+        # of the ids of some not yet loaded portion.
+        self._pending = []
+        # range of positions on the ids list that should be loaded first.
+        self._focus = (0, 0)
+
     def _lazy_work(self):
         """
         Main worker function that loads all the data at once, in small portions.
-        Each portion is '_step' number of elements long. Loads one
-        portion of elements with identifiers from the front
-        of the ids list and one portion from the back, in turns.
+        Each portion is '_step' number of elements long. Portions are
+        loaded in order of their distance from the currently focused range
+        of ids, that is the current page goes first, then the neighbouring
+        pages, then the rest. Distance is measured around the ids list
+        so that the last page counts as a neighbour of the first one.
+        When data is loaded by number the total count is not known
+        and portions are loaded one after another.
         """
         if self._src.lazy_offset is not None:
             any_left = True
@@ -73,36 +93,66 @@ class LazyWorker:
                     self._src.lazy_offset, self._step)
                 self._src.lazy_offset += self._step
         else:
-            flat = list(range(0, len(self._src._ids), self._step))
-            half_len = int(len(flat)/2)
-            mixed = [idx for idx in itertools.chain(*itertools.zip_longest(
-                flat[ :half_len], reversed(flat[half_len: ]))) if idx is not None]
-            for idx in mixed:
-                if not self._running:
-                    break
+            with self._queue_lock:
+                self._pending = [(0, idx) for idx in
+                                 range(0, len(self._src._ids), self._step)]
+                self._reorder_pending()
+            while self._running:
+                with self._queue_lock:
+                    if not self._pending:
+                        break
+                    _priority, idx = heapq.heappop(self._pending)
                 self._load_portion_by_ids(ids=self._src._ids[idx : idx+self._step])
 
+    def _reorder_pending(self):
+        """
+        Recalculate priorities of all the pending portions according to
+        the current focus. Should be called with the queue lock acquired.
+        """
+        portions_count = ceil(len(self._src._ids) / self._step)
+        if portions_count == 0:
+            return
+        first = self._focus[0] // self._step
+        last = max(self._focus[1] - 1, self._focus[0]) // self._step
+
+        def distance(idx):
+            portion = idx // self._step
+            if first <= portion <= last:
+                return 0
+            return min((first - portion) % portions_count,
+                       (portion - last) % portions_count)
+
+        self._pending = [(distance(idx), idx) for _priority, idx in
+                         self._pending]
+        heapq.heapify(self._pending)
+
+    def prioritize(self, from_idx, to_idx):
+        """
+        Make the loader fetch the given range of ids before anything else.
+        Should be called each time some new range of data is requested.
+        Order of the sorted data is assumed to follow the order of the ids.
+
+        :param from_idx: position of the first id on the ids list.
+        :param to_idx: position after the last id on the ids list.
+        """
+        with self._queue_lock:
+            self._focus = (from_idx, to_idx)
+            self._reorder_pending()
+
     def _load_portion_by_ids(self, ids):
         """
         Load some portion of data items with the given identifiers.
 
         :param ids: list of ids specifying which data items should be loaded.
         """
-        self._src._lazy_data.update(list(zip(map(str, ids),
-                                    self._src._query_portion_of_data(ids))))
-        self._src.data = self._src.produce_data(
-            [(val, None) for val in list(self._src._lazy_data.values())],
-            self._src._data_sorting_key)
+        self._src._merge_lazy_portion(
+            list(map(str, ids)), self._src._query_portion_of_data(ids))
 
     def _load_portion_by_number(self, offset, number):
         data = self._src._query_portion_of_data_by_number(offset, number)
         if data:
             ids = list(range(offset, offset + len(data)))
-            self._src._lazy_data.update(list(zip(map(str, ids), data)))
-            self._src.data = self._src.produce_data(
-                [(val, None) for val in list(self._src._lazy_data.values())],
-                self._src._data_sorting_key
-            )
+            self._src._merge_lazy_portion(list(map(str, ids)), data)
         return data
 
     @property
@@ -160,6 +210,9 @@ class DataSource(GObject.GObject, properties.PropertyAdapter,
         "length-changed": (
             GObject.SIGNAL_RUN_FIRST, None,
             (GObject.TYPE_INT64,)),
+        "range-changed": (
+            GObject.SIGNAL_RUN_FIRST, None,
+            (GObject.TYPE_INT64, GObject.TYPE_INT64)),
         'reload': (
             GObject.SIGNAL_RUN_FIRST, None, ())
     }
@@ -202,6 +255,13 @@ class DataSource(GObject.GObject, properties.PropertyAdapter,
         self._data_sorting_key = None
         # synchronization for an access to the `data` buffer.
         self._lock = threading.RLock()
+        # number of changes of the `data` buffer so far.
+        self._revision = 0
+        # (revision, from_idx, to_idx) of the latest changes, open range
+        # has None as its end.
+        self._changes = deque(maxlen=CHANGES_LOG_LENGTH)
+        # revision of the data that the latest items were generated from.
+        self.items_revision = 0
         # something to do when new data is available..
         self.on_new_data = None
         self.data_sets_ids_list = None
@@ -328,9 +388,43 @@ class DataSource(GObject.GObject, properties.PropertyAdapter,
         with self._lock:
             self._data = value
             self._length = len(value)
+            self._revision += 1
+            self._changes.append((self._revision, 0, None))
         self.emit('length-changed', self._length)
         self.emit("data-is-ready")
 
+    @property
+    def revision(self):
+        """
+        Number of changes of the `data` buffer so far, can be
+        used to find out whether some items are outdated.
+        """
+        return self._revision
+
+    def is_range_changed(self, revision, from_idx, to_idx):
+        """
+        Check whether any data items in the given range could have changed
+        since the given revision of the data. Range ending right before
+        some changed items is treated as changed too, as it could have been
+        completed with fillers.
+
+        :param revision: revision of the data the range comes from.
+        :param from_idx: index of the first data item.
+        :param to_idx: index after the last data item.
+
+        :return: True or False.
+        """
+        with self._lock:
+            if revision == self._revision:
+                return False
+            if not self._changes or self._changes[0][0] > revision + 1:
+                return True
+            for change_revision, change_from, change_to in self._changes:
+                if change_revision > revision and change_from <= to_idx and \
+                        (change_to is None or from_idx < change_to):
+                    return True
+            return False
+
     def reload(self):
         """
         Reload.
@@ -348,26 +442,95 @@ class DataSource(GObject.GObject, properties.PropertyAdapter,
         """
         Generate items and structure them into a nested list.
         """
-        data = self.data
+        with self._lock:
+            data = self._data.copy()
+            self.items_revision = self._revision
+        return self.nest_items(list(self._iter_items_normal(
+            data, self.from_idx, self.to_idx)))
+
+    def _iter_items_normal(self, data, from_idx, to_idx):
+        """
+        Generate items one by one, in the given range. If the range is
+        the last one then it is completed with fillers to the full page.
+
+        :param data: snapshot of the `data` buffer.
+        :param from_idx: index of the first data item.
+        :param to_idx: index after the last data item.
+        """
         rows, cols = self.target_spec["rows"], self.target_spec["columns"]
-        to = self.to_idx
-        if self.from_idx + rows*cols >= self._length:
-            to = self.from_idx + rows*cols
-        items = []
-        idx = 0
-        for index in range(self.from_idx, to):
-            if idx % cols == 0:
-                row = []
-                items.append(row)
-            idx += 1
-            if index < self._length and index < self.to_idx:
+        to = to_idx
+        if from_idx + rows*cols >= len(data):
+            to = from_idx + rows*cols
+        for index in range(from_idx, to):
+            if index < len(data) and index < to_idx:
                 item = self._produce_item(data[index])
-            elif index > self._length or index >= self.to_idx:
+            else:
                 item = Clutter.Actor()
                 self._prepare_filler(item)
             self._prepare_item(item)
-            row.append(item)
-        return items
+            yield item
+
+    def nest_items(self, items):
+        """
+        Structure a flat list of items into a nested list of rows.
+
+        :param items: flat list of items.
+
+        :return: list of rows, each being a list of items.
+        """
+        cols = self.target_spec["columns"]
+        return [items[idx : idx+cols] for idx in range(0, len(items), cols)]
+
+    def iter_items(self, from_idx, to_idx):
+        """
+        Generate items in the given range one by one, without touching
+        the current range. Useful for building items gradually, in the
+        background. Data items should be already available.
+
+        :param from_idx: index of the first data item.
+        :param to_idx: index after the last data item.
+
+        :return: tuple with revision of the data and an items generator.
+        """
+        with self._lock:
+            data = self._data.copy()
+            revision = self._revision
+        return revision, self._iter_items_normal(data, from_idx, to_idx)
+
+    def peek_range(self, direction, count):
+        """
+        Get the range that moving in the given direction would
+        result in, without actually moving.
+
+        :param direction: -1 or 1, that is backward or forward.
+        :param count: number of items in the range.
+
+        :return: tuple with the first and after the last index.
+        """
+        current = self.from_idx, self.to_idx
+        if direction == -1:
+            self.move_backward(count)
+        else:
+            self.move_forward(count)
+        peeked = self.from_idx, self.to_idx
+        self.from_idx, self.to_idx = current
+        return peeked
+
+    def is_range_loaded(self, from_idx, to_idx):
+        """
+        Check if all the data items in the given range are available.
+        Always true unless in the lazy loading mode.
+
+        :param from_idx: index of the first data item.
+        :param to_idx: index after the last data item.
+
+        :return: True or False
+        """
+        if not self.lazy_loading:
+            return True
+        with self._lock:
+            return to_idx <= len(self._data) and \
+                all(self._data[from_idx : to_idx])
 
     def _generate_items_flat(self):
         """
@@ -429,14 +592,8 @@ class DataSource(GObject.GObject, properties.PropertyAdapter,
 
         :return: list of data items or None if in the lazy loading mode.
         """
-        self.from_idx = self.to_idx % self._length if \
-                            self._length > 0 else 0
-        self.to_idx = min(self.from_idx + count, self._length)
-
-        if self.lazy_loading:
-            self._schedule_sending_data(1)
-        else:
-            return self._generate_items_normal()
+        self.move_forward(count)
+        return self.query_items(1)
 
     def query_items_backward(self, count):
         """
@@ -447,7 +604,28 @@ class DataSource(GObject.GObject, properties.PropertyAdapter,
         :param count: number of items to be returned.
 
         :return: list of data items or None if in the lazy loading mode.
-        """ 
+        """
+        self.move_backward(count)
+        return self.query_items(-1)
+
+    def move_forward(self, count):
+        """
+        Move the current range of data items forward, without
+        generating any items.
+
+        :param count: number of items in the range.
+        """
+        self.from_idx = self.to_idx % self._length if \
+                            self._length > 0 else 0
+        self.to_idx = min(self.from_idx + count, self._length)
+
+    def move_backward(self, count):
+        """
+        Move the current range of data items backward, without
+        generating any items.
+
+        :param count: number of items in the range.
+        """
         rows, cols = self.target_spec["rows"], self.target_spec["columns"]
         self.to_idx = self.from_idx or self._length
         if self.to_idx < count:
@@ -457,8 +635,18 @@ class DataSource(GObject.GObject, properties.PropertyAdapter,
         else:
             self.from_idx = self.to_idx - count
 
+    def query_items(self, direction):
+        """
+        Query items generated from data in the current range.
+
+        :param direction: -1 or 1, that is whether the range has been
+        moved backward or forward.
+
+        :return: list of data items or None if in the lazy loading mode.
+        """
         if self.lazy_loading:
-            self._schedule_sending_data(-1)
+            self._lazy_loader.prioritize(*self._required_range(direction))
+            self._schedule_sending_data(direction)
         else:
             return self._generate_items_normal()
 
@@ -524,6 +712,8 @@ class DataSource(GObject.GObject, properties.PropertyAdapter,
         self._ids = []
         # offset for lazy data
         self.lazy_offset = None
+        # direction of the latest request waiting for its data to be loaded.
+        self._awaited_direction = None
 
         # main lazy loading worker.
         self._lazy_loader = LazyWorker(self)
@@ -593,12 +783,33 @@ class DataSource(GObject.GObject, properties.PropertyAdapter,
     def _schedule_sending_data(self, direction):
         """
         Schedule sending the data as soon as it is available.
-        Data should be loaded in a background.
+        Data should be loaded in a background. If it is not complete yet
+        then the request is remembered and the lazy loader wakes it up
+        after merging the missing portion. Only the latest request is
+        remembered, any earlier ones are outdated by then.
 
         :param direction: -1 or 1, that is whether data should be
         sent from backward or forward.
         """
-        Clutter.threads_add_timeout(0, 100, self._send_data, direction)
+        with self._lock:
+            if self._has_data(direction):
+                self._awaited_direction = None
+                Clutter.threads_add_idle(0, self._send_data, direction)
+            else:
+                self._awaited_direction = direction
+
+    def _wake_up_sending_data(self):
+        """
+        Check if data awaited by the latest request has been completed and
+        if so, schedule sending it from the main loop. Called by the
+        lazy loader after each merged portion of data.
+        """
+        with self._lock:
+            direction = self._awaited_direction
+            if direction is None or not self._has_data(direction):
+                return
+            self._awaited_direction = None
+        Clutter.threads_add_idle(0, self._send_data, direction)
 
     def _send_data(self, direction):
         """
@@ -606,20 +817,38 @@ class DataSource(GObject.GObject, properties.PropertyAdapter,
 
         :param direction: data in which direction should be sent.
 
-        :return: True when no data available or False after sending the data.
+        :return: False, so that the main loop source is always removed.
         """
-        if self._has_data(direction):
-            if not callable(self.on_new_data):
-                raise exceptions.PisakException(
-                    'No data receiver has been declared.')
-            try:
-                self.on_new_data(self._generate_items_normal())
-            except TypeError as exc:
-                _LOG.error(exc)
-                raise
+        if not self._has_data(direction):
+            self._schedule_sending_data(direction)
             return False
+        if not callable(self.on_new_data):
+            raise exceptions.PisakException(
+                'No data receiver has been declared.')
+        try:
+            self.on_new_data(self._generate_items_normal())
+        except TypeError as exc:
+            _LOG.error(exc)
+            raise
+        return False
+
+    def _required_range(self, direction):
+        """
+        Get range of data indices that should be available before
+        sending the data in the given direction.
+
+        :param direction: -1 or 1, that is whether data should be
+        sent from backward or forward.
+
+        :return: tuple with the first and after the last index.
+        """
+        offset = self._lazy_loader.step
+        if direction == -1:
+            return max(self.from_idx - offset, 0), self.to_idx
+        elif direction == 1:
+            return self.from_idx, min(self.to_idx + offset, self._length)
         else:
-            return True
+            raise ValueError('Invalid direction. Must be -1 or 1.')
 
     def _has_data(self, direction):
         """
@@ -632,17 +861,81 @@ class DataSource(GObject.GObject, properties.PropertyAdapter,
 
         :return: True or False
         """
-        offset = self._lazy_loader.step
-        if direction == -1:
-            from_idx = max(self.from_idx - offset, 0)
-            to_idx = self.to_idx
-        elif direction == 1:
-            from_idx = self.from_idx
-            to_idx = min(self.to_idx + offset, self._length)
-        else:
-            raise ValueError('Invalid direction. Must be -1 or 1.')
+        from_idx, to_idx = self._required_range(direction)
+        with self._lock:
+            return to_idx <= len(self._data) and \
+                all(self._data[from_idx : to_idx])
+
+    def _merge_lazy_portion(self, ids, portion):
+        """
+        Merge a freshly loaded portion of data into the `data` buffer,
+        which is kept sorted all the time. Each new item is inserted in
+        its sorted position and a placeholder or a previous version of
+        the item with the same id is removed, so the cost of a single
+        portion does not depend on how much data has been loaded so far.
+        Emits the 'range-changed' signal with the span of indices that
+        have been affected.
+
+        :param ids: list of string identifiers of the new data items.
+        :param portion: list of raw data items, one for each of the `ids`.
+        """
+        cmp_key_factory = self._data_sorting_key
+        with self._lock:
+            if self._data and not isinstance(self._data[0], DataItem):
+                # plain placeholders left by `_check_ids_range`, they are
+                # converted only once, before the first merge.
+                self._data = self.produce_data(
+                    [(val, None) for val in self._lazy_data.values()],
+                    cmp_key_factory)
+                # order of all the items may have changed
+                self._changes.append((self._revision + 1, 0, None))
+            old_length = len(self._data)
+            from_idx, to_idx = old_length, 0
+            for ide, value in zip(ids, portion):
+                if ide in self._lazy_data:
+                    old_idx = self._find_data_item(
+                        self._lazy_data[ide], cmp_key_factory)
+                    if old_idx is not None:
+                        del self._data[old_idx]
+                        from_idx = min(from_idx, old_idx)
+                        to_idx = max(to_idx, old_idx + 1)
+                self._lazy_data[ide] = value
+                new_item = DataItem(value, cmp_key_factory(value))
+                new_idx = bisect_right(self._data, new_item)
+                self._data.insert(new_idx, new_item)
+                from_idx = min(from_idx, new_idx)
+                to_idx = max(to_idx, new_idx + 1)
+            self._length = len(self._data)
+            self._revision += 1
+            if from_idx < to_idx:
+                # all the following items are shifted if the length changes
+                self._changes.append((
+                    self._revision, from_idx,
+                    to_idx if self._length == old_length else None))
+        if self._length != old_length:
+            self.emit('length-changed', self._length)
+        if from_idx < to_idx:
+            self.emit('range-changed', from_idx, to_idx)
+        self.emit("data-is-ready")
+        self._wake_up_sending_data()
+
+    def _find_data_item(self, content, cmp_key_factory):
+        """
+        Find index of a data item with the given content in the
+        sorted `data` buffer. Should be called with the lock acquired.
 
-        return to_idx <= len(self.data) and all(self.data[from_idx : to_idx])
+        :param content: raw content of the data item.
+        :param cmp_key_factory: function producing comparison keys.
+
+        :return: index of the item or None if it could not be found.
+        """
+        probe = DataItem(content, cmp_key_factory(content))
+        idx = bisect_left(self._data, probe)
+        while idx < len(self._data) and not probe < self._data[idx]:
+            if self._data[idx].content is content:
+                return idx
+            idx += 1
+        return None
 
     def _clean_up_lazy(self):
         """
@@ -710,6 +1003,76 @@ class _Page(scanning.Group):
                 item.adjust()
 
 
+class _PageCache:
+    """
+    Cache of the already built pages. Each page is stored together with
+    revision of the data it has been generated from and it is never
+    returned once the data it shows has changed. The least recently used
+    pages are dropped when the capacity is exceeded.
+
+    :param capacity: maximum number of pages, 0 disables the cache.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._pages = OrderedDict()
+
+    def get(self, key, revision, is_changed):
+        """
+        Get page stored under the given key. Outdated page is dropped,
+        up-to-date one is marked with the current revision.
+
+        :param key: page identifier.
+        :param revision: current revision of the data.
+        :param is_changed: function telling whether the page has changed
+        since the revision it is stored with.
+
+        :return: page or None if there is no up-to-date page.
+        """
+        entry = self._pages.get(key)
+        if entry is None:
+            return None
+        if entry[0] != revision and is_changed(entry[0]):
+            del self._pages[key]
+            self._dispose(entry[1])
+            return None
+        self._pages[key] = (revision, entry[1])
+        self._pages.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, page, revision):
+        """
+        Store page under the given key.
+
+        :param key: page identifier.
+        :param page: page instance.
+        :param revision: revision of the data the page was generated from.
+        """
+        old = self._pages.pop(key, None)
+        if old is not None and old[1] is not page:
+            self._dispose(old[1])
+        if self.capacity == 0:
+            return
+        self._pages[key] = (revision, page)
+        while len(self._pages) > self.capacity:
+            _key, (_revision, evicted) = self._pages.popitem(last=False)
+            self._dispose(evicted)
+
+    def clear(self):
+        """
+        Drop all the pages.
+        """
+        for _revision, page in self._pages.values():
+            self._dispose(page)
+        self._pages.clear()
+
+    @staticmethod
+    def _dispose(page):
+        # pages still displayed are destroyed together with the pager
+        if page.get_parent() is None:
+            page.destroy()
+
+
 class PagerWidget(layout.Bin, properties.PropertyAdapter,
                   configurator.Configurable):
     """
@@ -763,7 +1126,11 @@ class PagerWidget(layout.Bin, properties.PropertyAdapter,
         "transition-duration": (
             GObject.TYPE_INT64, "transition duration",
             "duration of page transition", 0,
-            GObject.G_MAXUINT, 1000, GObject.PARAM_READWRITE)            
+            GObject.G_MAXUINT, 1000, GObject.PARAM_READWRITE),
+        "page-cache-size": (
+            GObject.TYPE_UINT, "page cache size",
+            "number of built pages kept for reuse", 0,
+            GObject.G_MAXUINT, 5, GObject.PARAM_READWRITE)
     }
 
     def __init__(self):
@@ -792,6 +1159,11 @@ class PagerWidget(layout.Bin, properties.PropertyAdapter,
         self._columns = 4
         self._current_page = None
         self.old_page = None
+        self._page_cache = _PageCache(5)
+        # jobs building the neighbouring pages in the background.
+        self._prefetch_jobs = []
+        self._prefetch_source = None
+        self.connect('destroy', lambda *_: self._on_destroy())
         self.apply_props()
 
     @property
@@ -862,6 +1234,9 @@ class PagerWidget(layout.Bin, properties.PropertyAdapter,
 
     @data_source.setter
     def data_source(self, value):
+        # pages and jobs of the previous source are of no use any more
+        self._abandon_prefetch()
+        self._page_cache.clear()
         self._data_source = value
         if value is not None:
             value.on_new_data = self.on_new_items
@@ -919,6 +1294,19 @@ class PagerWidget(layout.Bin, properties.PropertyAdapter,
         self.new_page_transition.set_duration(value)
         self.old_page_transition.set_duration(value)
 
+    @property
+    def page_cache_size(self):
+        """
+        Maximum number of already built pages kept for reuse,
+        0 disables the cache.
+        """
+        return self._page_cache.capacity
+
+    @page_cache_size.setter
+    def page_cache_size(self, value):
+        self._page_cache.capacity = value
+        self._page_cache.clear()
+
     @property
     def ready(self):
         """
@@ -945,23 +1333,169 @@ class PagerWidget(layout.Bin, properties.PropertyAdapter,
             self.page_count = ceil(data_length /
                                    (self.rows*self.columns))
 
+    def _page_key(self):
+        """
+        Key identifying the current page in the page cache.
+        """
+        return (self.data_source.data_set_idx, self.data_source.from_idx,
+                self.data_source.to_idx)
+
+    def _query_page(self, direction):
+        """
+        Query the data source for a page lying in the given direction
+        and introduce it. Pages that have already been built are taken
+        from the page cache. In the lazy loading mode the page may
+        be introduced later, when its data is loaded.
+
+        :param direction: 1 for the next page, -1 for the previous one
+        and 0 for the initial one.
+        """
+        if self.data_source.custom_topology:
+            if direction == -1:
+                items = self.data_source.get_items_custom_previous()
+            else:
+                items = self.data_source.get_items_custom_next()
+            if items:
+                self._introduce_new_page(items)
+            return
+        count = self.rows * self.columns
+        if direction == -1:
+            self.data_source.move_backward(count)
+        else:
+            self.data_source.move_forward(count)
+        page = self._get_cached_page(self._page_key())
+        if page is not None and page.get_parent() is None:
+            if direction == 0:
+                page.set_x(0)
+            self._introduce_page(page)
+        else:
+            items = self.data_source.query_items(direction or 1)
+            if items:
+                self._introduce_new_page(items)
+
+    def _get_cached_page(self, key):
+        """
+        Get an up-to-date page from the page cache.
+
+        :param key: page identifier, as returned by `_page_key`.
+
+        :return: page or None.
+        """
+        _data_set_idx, from_idx, to_idx = key
+        return self._page_cache.get(
+            key, self.data_source.revision,
+            lambda revision: self.data_source.is_range_changed(
+                revision, from_idx, to_idx))
+
+    def _on_destroy(self):
+        """
+        Drop all the background jobs and the cached pages.
+        """
+        self._abandon_prefetch()
+        self._page_cache.clear()
+
+    def _abandon_prefetch(self):
+        """
+        Drop all the scheduled background jobs, together with
+        the items they have already produced.
+        """
+        for job in self._prefetch_jobs:
+            self._dispose_prefetched(job)
+        self._prefetch_jobs = []
+
+    @staticmethod
+    def _dispose_prefetched(job):
+        """
+        Destroy the items produced by the given background job so far,
+        none of them has been placed on a page yet.
+
+        :param job: background job, as stored in the jobs list.
+        """
+        for item in job[3]:
+            item.destroy()
+        job[3].clear()
+
+    def _schedule_prefetch(self):
+        """
+        Schedule building the next and the previous pages in the background,
+        so that flipping to them only swaps in a ready page from the page
+        cache. Pages are built in idle time, with a low priority and one
+        item at a time, so that no scanning timeouts are delayed.
+        Any previously scheduled jobs are abandoned.
+        """
+        self._abandon_prefetch()
+        source = self.data_source
+        if source is None or source.custom_topology or \
+                self._page_count <= 1 or self._page_cache.capacity == 0:
+            return
+        count = self.rows * self.columns
+        for direction in (1, -1):
+            from_idx, to_idx = source.peek_range(direction, count)
+            key = (source.data_set_idx, from_idx, to_idx)
+            if key not in [job[0] for job in self._prefetch_jobs] and \
+                    self._get_cached_page(key) is None and \
+                    source.is_range_loaded(from_idx, to_idx):
+                revision, items = source.iter_items(from_idx, to_idx)
+                self._prefetch_jobs.append((key, revision, items, []))
+        if self._prefetch_jobs and self._prefetch_source is None:
+            self._prefetch_source = Clutter.threads_add_idle(
+                GLib.PRIORITY_LOW, self._prefetch_step, None)
+
+    def _prefetch_step(self, _data):
+        """
+        Perform a single step of the background page building,
+        that is produce one item or put the complete page into the cache.
+
+        :return: True if there is some more work to do, False otherwise.
+        """
+        while self._prefetch_jobs:
+            key, revision, items, ready = self._prefetch_jobs[0]
+            if revision != self.data_source.revision:
+                self._dispose_prefetched(self._prefetch_jobs.pop(0))
+                continue
+            item = next(items, None)
+            if item is not None:
+                ready.append(item)
+            else:
+                self._prefetch_jobs.pop(0)
+                page = _Page(self.data_source.nest_items(ready),
+                             self.page_spacing, self.page_strategy,
+                             self.sound, self.row_sounds)
+                self._page_cache.put(key, page, revision)
+            return True
+        self._prefetch_source = None
+        return False
+
     def _introduce_new_page(self, items):
+        """
+        Build a new page out of the given items and introduce it.
+        The page is stored in the page cache for a future reuse.
+
+        :param items: list of items to be placed on the new page.
+        """
+        _new_page = _Page(items, self.page_spacing, self.page_strategy,
+                          self.sound, self.row_sounds)
+        if not self.data_source.custom_topology:
+            self._page_cache.put(self._page_key(), _new_page,
+                                 self.data_source.items_revision)
+        self._introduce_page(_new_page)
+
+    def _introduce_page(self, _new_page):
         """
         Method for adding and displaying new page and disposing of the old one.
         When 'direction' is 0 then adjusting the content of the new page happens
         immediately, otherwise it is performed in the `_clean_up` method when
         any page transitions are already over.
 
-        :param items: list of items to be placed on the new page.
+        :param _new_page: page to be displayed.
         """
-        _new_page = _Page(items, self.page_spacing, self.page_strategy,
-                          self.sound, self.row_sounds)
         direction = self._current_direction
         if direction == 0:
             self._current_page = _new_page
             self._current_page.set_id(self.get_id() + "_page")
             self.add_child(self._current_page)
             self._current_page.adjust_content()
+            self._schedule_prefetch()
         else:
             self.old_page = self._current_page
             new_page_from = self.old_page.get_x() + direction * \
@@ -1008,14 +1542,8 @@ class PagerWidget(layout.Bin, properties.PropertyAdapter,
                                             "rows": self.rows,
                                             "columns": self.columns}
             self._current_direction = 0
-            if self.data_source.custom_topology:
-                items = self.data_source.get_items_custom_next()
-            else:
-                items = self.data_source.query_items_forward(
-                    self.rows*self.columns)
             self._calculate_page_count(self.data_source.length)
-            if items:
-                self._introduce_new_page(items)
+            self._query_page(0)
             self.ready = True
 
     def _automatic_timeout(self, _data):
@@ -1041,6 +1569,7 @@ class PagerWidget(layout.Bin, properties.PropertyAdapter,
             if self.contains(self.old_page):
                 self.remove_child(self.old_page)
         self.old_page = None
+        self._schedule_prefetch()
 
     def scan_page(self):
         """
@@ -1066,13 +1595,7 @@ class PagerWidget(layout.Bin, properties.PropertyAdapter,
                 self.data_source.page_idx is not None else \
                 (self.page_index+1) % self._page_count
             self._current_direction = 1
-            if self.data_source.custom_topology:
-                items = self.data_source.get_items_custom_next()
-            else:
-                items = self.data_source.query_items_forward(
-                    self.rows * self.columns)
-            if items:
-                self._introduce_new_page(items)
+            self._query_page(1)
 
     def previous_page(self):
         """
@@ -1084,13 +1607,7 @@ class PagerWidget(layout.Bin, properties.PropertyAdapter,
                     self.page_index - 1 if self.page_index >= 1 \
                     else self._page_count - 1)
             self._current_direction = -1
-            if self.data_source.custom_topology:
-                items = self.data_source.get_items_custom_previous()
-            else:
-                items = self.data_source.query_items_backward(
-                    self.columns * self.rows)
-            if items:
-                self._introduce_new_page(items)
+            self._query_page(-1)
 
     def run_automatic(self):
         """
@@ -6,8 +6,8 @@ import time
 from gi.repository import Clutter, GObject
 
 import pisak
-from pisak import logger, exceptions, properties, configurator, dirs
-from pisak.sound_effects import Synthesizer
+from pisak import logger, exceptions, properties, configurator, dirs, \
+    speech
 
 
 _LOG = logger.get_logger(__name__)
@@ -949,14 +949,13 @@ class BaseStrategy(Strategy, properties.PropertyAdapter,
                             self.player.play(selection.sounds[icon_name])
                     else:
                         if pisak.config.as_bool('speech_synthesis'):
-                            synthesizer = Synthesizer(label)
-                            synthesizer.read(scan_time)
+                            speech.get_service().say(label, scan_time)
                 elif isinstance(selection, Group):
                     self.player.play(selection.sound)
                 elif isinstance(selection, pisak.widgets.PhotoTile):
                     if pisak.config.as_bool('speech_synthesis'):
-                        synthesizer = Synthesizer(selection.label_text)
-                        synthesizer.read(scan_time)
+                        speech.get_service().say(selection.label_text,
+                                                 scan_time)
                     else:
                         self.play_scanning_sound()
                 else:
@@ -0,0 +1,196 @@
+"""
+Smoothing of the cursor coordinates coming from the gaze trackers,
+so that the cursor does not jitter and does not leave the hovered widgets
+by accident. Each filter processes both coordinates of a sample at once,
+in plain arithmetic, and keeps its state between the samples.
+"""
+import math
+
+from pisak import logger
+
+
+_LOG = logger.get_logger(__name__)
+
+
+"""
+Minimal interval between two samples, in seconds. Samples with the same
+or decreasing timestamps are treated as if they came that much later than
+the previous ones, so that no sample is dropped or divides by zero.
+"""
+MIN_INTERVAL = 0.001
+
+
+class NullFilter:
+    """
+    Filter that passes the samples through unchanged.
+    """
+
+    def filter(self, x, y, timestamp):
+        """
+        Filter a single sample.
+
+        :param x: x coordinate, in pixels.
+        :param y: y coordinate, in pixels.
+        :param timestamp: time of the sample, in seconds.
+
+        :return: tuple with the filtered x and y coordinates.
+        """
+        return x, y
+
+    def reset(self):
+        """
+        Forget all the previous samples.
+        """
+        pass
+
+
+class OneEuroFilter(NullFilter):
+    """
+    One Euro filter, that is a low-pass filter whose cutoff frequency
+    grows with the speed of the cursor, so that fixations are smoothed
+    strongly while saccades lag just a little.
+
+    :param min_cutoff: cutoff frequency for a still cursor, in Hz.
+    :param beta: growth of the cutoff frequency with the speed,
+    per pixel per second.
+    :param d_cutoff: cutoff frequency of the speed estimate, in Hz.
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=0.005, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    @staticmethod
+    def _alpha(cutoff, interval):
+        tau = 1 / (2 * math.pi * cutoff)
+        return 1 / (1 + tau / interval)
+
+    def filter(self, x, y, timestamp):
+        if self._last is None:
+            self._last = x, y, timestamp
+            return x, y
+        last_x, last_y, last_time = self._last
+        interval = max(MIN_INTERVAL, timestamp - last_time)
+        alpha = self._alpha(self.d_cutoff, interval)
+        self._dx += alpha * ((x - last_x) / interval - self._dx)
+        self._dy += alpha * ((y - last_y) / interval - self._dy)
+        speed = math.sqrt(self._dx * self._dx + self._dy * self._dy)
+        alpha = self._alpha(self.min_cutoff + self.beta * speed, interval)
+        x = last_x + alpha * (x - last_x)
+        y = last_y + alpha * (y - last_y)
+        self._last = x, y, last_time + interval
+        return x, y
+
+    def reset(self):
+        self._last = None
+        self._dx = self._dy = 0.0
+
+
+class KalmanFilter(NullFilter):
+    """
+    Kalman filter with a constant velocity model, run for each coordinate
+    separately, with the same covariances.
+
+    :param process_noise: variance of the acceleration, in pixels
+    per second squared, squared.
+    :param measurement_noise: variance of the measurement, in pixels squared.
+    """
+
+    def __init__(self, process_noise=5e7, measurement_noise=400.0):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.reset()
+
+    def filter(self, x, y, timestamp):
+        if self._state is None:
+            self._state = [x, 0.0, y, 0.0]
+            self._time = timestamp
+            return x, y
+        interval = max(MIN_INTERVAL, timestamp - self._time)
+        self._time += interval
+        pos_x, vel_x, pos_y, vel_y = self._state
+        # prediction:
+        pos_x += vel_x * interval
+        pos_y += vel_y * interval
+        p00, p01, p11 = self._covariance
+        q = self.process_noise
+        dt2 = interval * interval
+        p00 += interval * (2 * p01 + interval * p11) + q * dt2 * dt2 / 4
+        p01 += interval * p11 + q * dt2 * interval / 2
+        p11 += q * dt2
+        # correction:
+        gain_pos = p00 / (p00 + self.measurement_noise)
+        gain_vel = p01 / (p00 + self.measurement_noise)
+        residual_x, residual_y = x - pos_x, y - pos_y
+        pos_x += gain_pos * residual_x
+        vel_x += gain_vel * residual_x
+        pos_y += gain_pos * residual_y
+        vel_y += gain_vel * residual_y
+        self._covariance = (
+            (1 - gain_pos) * p00, (1 - gain_pos) * p01, p11 - gain_vel * p01)
+        self._state = [pos_x, vel_x, pos_y, vel_y]
+        return pos_x, pos_y
+
+    def reset(self):
+        self._state = None
+        self._time = None
+        self._covariance = (self.measurement_noise, 0.0, 0.0)
+
+
+class MedianFilter(NullFilter):
+    """
+    Moving median over the last samples, kept in a ring buffer.
+    Removes single outliers without blurring the saccades.
+
+    :param size: number of the samples, odd.
+    """
+
+    def __init__(self, size=5):
+        self.size = size
+        self.reset()
+
+    def filter(self, x, y, timestamp):
+        self._xs[self._idx] = x
+        self._ys[self._idx] = y
+        self._idx = (self._idx + 1) % self.size
+        if self._count < self.size:
+            self._count += 1
+            xs, ys = self._xs[:self._count], self._ys[:self._count]
+        else:
+            xs, ys = self._xs, self._ys
+        middle = len(xs) // 2
+        return sorted(xs)[middle], sorted(ys)[middle]
+
+    def reset(self):
+        self._xs = [0.0] * self.size
+        self._ys = [0.0] * self.size
+        self._idx = 0
+        self._count = 0
+
+
+"""
+Available filters, by their names used in the config.
+"""
+FILTERS = {
+    "none": NullFilter,
+    "one-euro": OneEuroFilter,
+    "kalman": KalmanFilter,
+    "median": MedianFilter
+}
+
+
+def create_filter(name):
+    """
+    Create a filter with the default parameters.
+
+    :param name: name of the filter, one of the `FILTERS` keys.
+
+    :return: filter instance, `NullFilter` if the name is not known.
+    """
+    try:
+        return FILTERS[name]()
+    except KeyError:
+        _LOG.warning("Unknown smoothing filter: {}.".format(name))
+        return NullFilter()
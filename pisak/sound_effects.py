@@ -1,13 +1,17 @@
 """
 Sound effects player.
 """
+import os
+import time
+import signal
 import subprocess
 import threading
+from collections import deque, OrderedDict
 
 import gi
 gi.require_version('Gst', '1.0')
 
-from gi.repository import GObject, Gst
+from gi.repository import GObject, GLib, Gst
 
 import pisak
 from pisak import arg_parser
@@ -21,11 +25,159 @@ GObject.threads_init()
 Gst.init(arg_parser.get_args().args)
 
 
+"""
+Format that all the sound effects are decoded to, so that any of them can
+be played by any of the voices.
+"""
+EFFECTS_CAPS = "audio/x-raw,format=S16LE,layout=interleaved," \
+               "rate=44100,channels=2"
+
+"""
+Number of bytes per second of a decoded sound effect.
+"""
+EFFECTS_BYTE_RATE = 44100 * 2 * 2
+
+"""
+Number of voices, that is sound effects that can be played simultaneously.
+"""
+VOICES_COUNT = 4
+
+"""
+Size of the audio sinks' buffers and of their segments, in microseconds.
+The smaller they are the sooner sound effects are heard.
+"""
+SINK_BUFFER_TIME = 40000
+SINK_LATENCY_TIME = 10000
+
+"""
+Audio sinks to be tried, in order of preference.
+"""
+SINKS = ("pulsesink", "alsasink", "autoaudiosink")
+
+"""
+Maximum time of waiting for the next chunk of a decoded sound, in seconds.
+"""
+DECODING_TIMEOUT = 5
+
+"""
+Maximum total size of the decoded sounds kept in memory, other than
+the registered sound effects, in bytes. Least recently played ones
+are dropped first.
+"""
+DECODED_CACHE_SIZE = 32 * 1024 * 1024
+
+
+def decode(path):
+    """
+    Decode the whole audio file to raw samples, in the `EFFECTS_CAPS` format.
+
+    :param path: path to the audio file.
+
+    :return: decoded samples, bytes, or None if decoding failed.
+    """
+    pipeline = Gst.parse_launch(
+        "filesrc name=src ! decodebin ! audioconvert ! audioresample ! "
+        "capsfilter caps={} ! appsink name=sink sync=false".format(
+            EFFECTS_CAPS))
+    pipeline.get_by_name("src").set_property("location", path)
+    sink = pipeline.get_by_name("sink")
+    bus = pipeline.get_bus()
+    chunks = []
+    pipeline.set_state(Gst.State.PLAYING)
+    try:
+        while True:
+            sample = sink.emit("try-pull-sample",
+                               DECODING_TIMEOUT * Gst.SECOND)
+            if sample is not None:
+                buf = sample.get_buffer()
+                chunks.append(buf.extract_dup(0, buf.get_size()))
+                continue
+            if sink.is_eos():
+                return b"".join(chunks)
+            error = bus.pop_filtered(Gst.MessageType.ERROR)
+            _LOG.warning("Could not decode sound {}: {}.".format(
+                path, error.parse_error()[0].message if error else "timeout"))
+            return None
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+
+
+class _Voice:
+    """
+    Pipeline playing the decoded sound effects pushed to it, being kept
+    running all the time, so that nothing has to be set up before a sound
+    can be heard.
+    """
+
+    def __init__(self, caps, volume):
+        self.busy_until = 0
+        self._pipeline = Gst.Pipeline()
+        self._src = Gst.ElementFactory.make("appsrc")
+        self._src.set_property("caps", caps)
+        self._src.set_property("format", Gst.Format.TIME)
+        self._src.set_property("is-live", True)
+        self._src.set_property("do-timestamp", True)
+        convert = Gst.ElementFactory.make("audioconvert")
+        self._volume = Gst.ElementFactory.make("volume")
+        self._volume.set_property("volume", volume)
+        sink = self._make_sink()
+        for element in (self._src, convert, self._volume, sink):
+            self._pipeline.add(element)
+        self._src.link(convert)
+        convert.link(self._volume)
+        self._volume.link(sink)
+        self._pipeline.set_state(Gst.State.PLAYING)
+
+    @staticmethod
+    def _make_sink():
+        for name in SINKS:
+            sink = Gst.ElementFactory.make(name)
+            if sink is not None:
+                break
+        settings = {"sync": False, "buffer-time": SINK_BUFFER_TIME,
+                    "latency-time": SINK_LATENCY_TIME}
+        for prop, value in settings.items():
+            if sink.find_property(prop) is not None:
+                sink.set_property(prop, value)
+        return sink
+
+    def set_volume(self, volume):
+        self._volume.set_property("volume", volume)
+
+    def play(self, buf, duration, max_duration=None):
+        """
+        Play the sound, cut off whatever is still being played.
+
+        :param buf: buffer with the decoded sound.
+        :param duration: duration of the sound, in seconds.
+        :param max_duration: optional, number of seconds that the sound
+        should be limited to.
+        """
+        size = buf.get_size()
+        if max_duration is not None and max_duration < duration:
+            duration = max(0, max_duration)
+            # whole frames only, 4 bytes each:
+            size = int(duration * EFFECTS_BYTE_RATE) // 4 * 4
+        now = time.monotonic()
+        if self.busy_until > now:
+            self._pipeline.send_event(Gst.Event.new_flush_start())
+            self._pipeline.send_event(Gst.Event.new_flush_stop(False))
+        self.busy_until = now + duration
+        self._src.emit("push-buffer", buf.copy_region(
+            Gst.BufferCopyFlags.MEMORY, 0, size))
+
+    def close(self):
+        self._pipeline.set_state(Gst.State.NULL)
+
+
 class SoundEffectsPlayer:
     """
-    Player of some simple sound effects. Audio files are loaded just
-    once when registered and then they are stored and available in a sounds pool,
-    throughout the class' entire lifetime.
+    Player of some simple sound effects. Registered sounds are decoded to
+    memory just once, on start, and kept throughout the class' entire
+    lifetime. Other audio files, i.e. the rendered speech, are decoded
+    when played for the first time, by a separate thread, and kept in
+    memory up to `DECODED_CACHE_SIZE`. Decoded sounds are played by a pool
+    of voices, so that the effects can overlap.
 
     :param sounds_dict: dictionary of sounds.
     """
@@ -34,10 +186,23 @@ class SoundEffectsPlayer:
         super().__init__()
         self.sounds = sounds_dict
         self._volume = pisak.config.as_int('sound_effects_volume') / 100
-        self._playbin = Gst.ElementFactory.make('playbin', 'button_sound')
-        self._playbin.set_property("volume", self.volume)
-        self._bus = self._playbin.get_bus()
-        self._bus.connect('message', self._on_message)
+        # decoded sounds, path: (buffer, duration) or None if not decodable,
+        # registered ones and the other ones, least recently played first.
+        self._effects = {path: self._decode(path)
+                         for path in sounds_dict.values()}
+        self._decoded = OrderedDict()
+        self._decoded_size = 0
+        # number of the play requests so far and the newest one waiting
+        # for decoding, (path, max_duration, request number):
+        self._requests = 0
+        self._wanted = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._decoder = threading.Thread(target=self._work, daemon=True)
+        self._decoder.start()
+        caps = Gst.Caps.from_string(EFFECTS_CAPS)
+        self._voices = [_Voice(caps, self._volume)
+                        for _ in range(VOICES_COUNT)]
 
     @property
     def volume(self):
@@ -51,52 +216,247 @@ class SoundEffectsPlayer:
         vol = float(value)
         if 0 <= vol <= 1:
             self._volume = vol
-            self._playbin.set_property("volume", vol)
+            for voice in self._voices:
+                voice.set_volume(vol)
         else:
             msg = "Provided value must be between 0 and 1. Received {}."
             _LOG.error(msg.format(vol))
-        
-    def play(self, sound_name):
+
+    def play(self, sound_name, max_duration=None):
         """
         Play a sound. Sounds are played in a thread-safe, non-blocking manner.
+        If all the voices are busy, the one that is closest to finishing
+        is cut off. If the sound has not been decoded yet, it is played
+        once decoded, unless any other sound has been played in the meantime.
 
-        :param sound_name: name of a previously registered sound.
+        :param sound_name: name of a previously registered sound or
+        path to an audio file.
+        :param max_duration: optional, max number of seconds that the sound
+        should be limited to.
         """
-        self.volume = self.volume
-        self._playbin.set_state(Gst.State.READY)
-        if sound_name in self.sounds:
-            self._playbin.set_property('uri', 'file://' + self.sounds[sound_name])
-        else:
-            self._playbin.set_property('uri', 'file://' + sound_name)
-        self._bus.add_signal_watch()
-        self._playbin.set_state(Gst.State.READY)
-        self._playbin.set_state(Gst.State.PLAYING)
-            
-    def _free_resource(self):
-        self._bus.remove_signal_watch()
-        self._playbin.set_state(Gst.State.NULL)
-        msg = 'Resources freed from playbin with file: ' +\
-              str(self._playbin.get_property('uri'))
-        _LOG.debug(msg)
-
-    def _on_message(self, _bus, message):
-        if message.type == Gst.MessageType.EOS:
-            self._free_resource()
-        elif message.type == Gst.MessageType.ERROR:
-            _LOG.warning("An error occured while playing file: " +\
-                         str(self._playbin.get_property('uri')))
-            self._free_resource()
+        path = self.sounds.get(sound_name, sound_name)
+        with self._condition:
+            self._requests += 1
+            if path in self._effects:
+                decoded = self._effects[path]
+            elif path in self._decoded:
+                self._decoded.move_to_end(path)
+                decoded = self._decoded[path]
+            else:
+                self._wanted = (path, max_duration, self._requests)
+                self._condition.notify()
+                return
+            self._wanted = None
+        self._play_decoded(decoded, max_duration)
+
+    def close(self):
+        """
+        Stop all the voices, free the audio resources.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        for voice in self._voices:
+            voice.close()
+
+    @staticmethod
+    def _decode(path):
+        data = decode(path)
+        return None if not data else \
+            (Gst.Buffer.new_wrapped(data), len(data) / EFFECTS_BYTE_RATE)
+
+    def _play_decoded(self, decoded, max_duration):
+        if decoded is None:
+            return
+        voice = min(self._voices, key=lambda voice: voice.busy_until)
+        voice.play(*decoded, max_duration=max_duration)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while self._wanted is None and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                (path, max_duration, request), self._wanted = \
+                    self._wanted, None
+            decoded = self._decode(path)
+            GLib.idle_add(self._on_decoded, path, decoded, max_duration,
+                          request)
+
+    def _on_decoded(self, path, decoded, max_duration, request):
+        with self._condition:
+            if path in self._decoded:
+                self._decoded_size -= self._get_size(self._decoded.pop(path))
+            self._decoded[path] = decoded
+            self._decoded_size += self._get_size(decoded)
+            while self._decoded_size > DECODED_CACHE_SIZE and \
+                    len(self._decoded) > 1:
+                _path, dropped = self._decoded.popitem(last=False)
+                self._decoded_size -= self._get_size(dropped)
+            is_newest = request == self._requests and not self._closed
+        if is_newest:
+            self._play_decoded(decoded, max_duration)
+        return False
+
+    @staticmethod
+    def _get_size(decoded):
+        return decoded[0].get_size() if decoded is not None else 0
+
+
+"""
+Policies of reading out the utterances. With the `QUEUE` one an utterance
+is read out as soon as there is a free synthesis process, so up to
+`MAX_SYNTH_PROCESSES` utterances may be read at the same time. With the
+`CANCEL_PREVIOUS` one the previous utterances from the same channel are
+cancelled first, both the waiting ones and the ones being read.
+"""
+QUEUE = "queue"
+CANCEL_PREVIOUS = "cancel-previous"
+
+"""
+Maximum number of speech synthesis processes running at the same time.
+"""
+MAX_SYNTH_PROCESSES = 2
+
+
+_QUEUE_STORE = {}
+
+
+class SpeechQueue:
+    """
+    Queue of the utterances to be read out. Each utterance is read by
+    a separate speech synthesis process, but no more than `max_processes`
+    of them run at the same time, the rest waits. Utterances that have
+    waited for too long are dropped. Ends of the processes are watched
+    on the main loop, no threads are involved.
+
+    :param max_processes: maximum number of processes running at once.
+    """
+
+    def __init__(self, max_processes=MAX_SYNTH_PROCESSES):
+        self.max_processes = max_processes
+        self._lock = threading.Lock()
+        self._waiting = deque()
+        # synthesizers being read out, pid: synthesizer.
+        self._running = {}
+
+    def add(self, synthesizer):
+        """
+        Add the utterance to the queue, according to its policy.
+
+        :param synthesizer: synthesizer with the utterance.
+        """
+        with self._lock:
+            if synthesizer.policy == CANCEL_PREVIOUS:
+                self._cancel([previous for previous in
+                              list(self._waiting) +
+                              list(self._running.values())
+                              if previous.channel == synthesizer.channel])
+            self._waiting.append(synthesizer)
+            self._start_waiting()
+
+    def cancel(self, synthesizer):
+        """
+        Cancel the utterance, stop reading it or remove it from the queue.
+
+        :param synthesizer: synthesizer with the utterance.
+        """
+        with self._lock:
+            self._cancel([synthesizer])
+
+    def cancel_all(self):
+        """
+        Cancel all the utterances.
+        """
+        with self._lock:
+            self._cancel(list(self._waiting) + list(self._running.values()))
+
+    def _cancel(self, synthesizers):
+        for synthesizer in synthesizers:
+            if synthesizer in self._waiting:
+                self._waiting.remove(synthesizer)
+                synthesizer._finish(False)
+            elif synthesizer.process is not None and \
+                    not synthesizer.cancelled:
+                synthesizer.cancelled = True
+                # the process stays in the running ones until it exits,
+                # so that the limit of the processes holds.
+                try:
+                    os.killpg(synthesizer.process.pid, signal.SIGTERM)
+                except OSError as exc:
+                    _LOG.debug(exc)
+
+    def _start_waiting(self):
+        now = time.monotonic()
+        while self._waiting and len(self._running) < self.max_processes:
+            synthesizer = self._waiting.popleft()
+            if synthesizer.deadline is not None and now > synthesizer.deadline:
+                synthesizer._finish(False)
+                continue
+            try:
+                # new session, so that the whole group of the processes
+                # spawned by the synthesizer can be killed at once.
+                process = subprocess.Popen(
+                    synthesizer.get_command(), start_new_session=True,
+                    stderr=None if pisak.arg_parser.get_args().debug
+                    else subprocess.DEVNULL)
+            except OSError as exc:
+                _LOG.warning("Could not start speech synthesis: {}.".format(
+                    exc))
+                synthesizer._finish(False)
+                continue
+            synthesizer.process = process
+            self._running[process.pid] = synthesizer
+            GLib.child_watch_add(GLib.PRIORITY_DEFAULT, process.pid,
+                                 self._on_exit)
+
+    def _on_exit(self, pid, _status):
+        with self._lock:
+            synthesizer = self._running.pop(pid, None)
+            self._start_waiting()
+        if synthesizer is not None:
+            synthesizer._finish(not synthesizer.cancelled)
+
+
+def get_speech_queue():
+    """
+    Retrieve the speech queue shared by all the synthesizers. Queue is
+    created just once and then is stored as a module-level variable.
+
+    :return: speech queue.
+    """
+    try:
+        queue = _QUEUE_STORE["queue"]
+    except KeyError:
+        queue = SpeechQueue()
+        _QUEUE_STORE["queue"] = queue
+    return queue
 
 
 class Synthesizer:
     """
-    Speech synthesizer. Uses Milena text-to-speech program.
+    Speech synthesizer. Uses Milena text-to-speech program. Utterances
+    are read out by the shared `SpeechQueue`, in a non-blocking mode.
 
     :param text: text to be read, string.
+    :param policy: policy of reading out, `QUEUE` or `CANCEL_PREVIOUS`.
+    :param stale_after: optional, max number of seconds that the
+    utterance can wait in the queue, it is dropped afterwards.
+    :param channel: optional, name of the channel of the utterance,
+    the `CANCEL_PREVIOUS` policy cancels only the utterances
+    from the same channel.
     """
-    def __init__(self, text):
+    def __init__(self, text, policy=QUEUE, stale_after=None, channel=None):
         self.text = text
+        self.policy = policy
+        self.channel = channel
+        self.stale_after = stale_after
+        self.deadline = None
         self.process = None
+        self.cancelled = False
+        self._timeout = None
+        self._callback = None
 
     @staticmethod
     def _sec_converter(seconds):
@@ -113,38 +473,56 @@ class Synthesizer:
         seconds = seconds - (minutes*60)
         return "{0:02d}:{1:02d}".format(minutes, seconds)
 
-    def read(self, timeout=None):
+    def get_command(self):
         """
-        Read the text out loud. Milena is spawned as a subprocess
-        in a non-blocking mode.
+        Get the command reading the text out loud.
+
+        :return: list of the program arguments.
+        """
+        command = ["milena_say"]
+        if self._timeout is not None and self._timeout > 0:
+            command.append("-S trim 0 {}".format(
+                self._sec_converter(self._timeout)))
+        command.append(self.text)
+        return command
+
+    def read(self, timeout=None, callback=None):
+        """
+        Read the text out loud. Returns immediately, the text is queued.
 
         :param timeout: optional, max number of seconds
         that the reading should be limited to.
+        :param callback: optional, function to be called on the main loop
+        when the reading ends, with a boolean telling whether
+        the text has been read out completely, that is not cancelled,
+        dropped or failed.
         """
-        if timeout is None or timeout <= 0:
-            self.process = subprocess.Popen(["milena_say", self.text])
-        else:
-            timeout = self._sec_converter(timeout)
-            if pisak.arg_parser.get_args().debug:
-                call = 'milena_say "-S trim 0 {}" {}'
-            else:
-                call = 'milena_say "-S trim 0 {}" {} 2>/dev/null'
-            self.process = subprocess.Popen([call.format(timeout,
-                                                         self.text)],
-                                            shell=True)
+        self._timeout = timeout
+        self._callback = callback
+        self.cancelled = False
+        if self.stale_after is not None:
+            self.deadline = time.monotonic() + self.stale_after
+        get_speech_queue().add(self)
 
     def read_and_call(self, func_to_call, timeout=None):
         """
         Read the text out loud and then, when finished,
-        call some function. Everything is executed
-        from a separate thread.
+        call some function on the main loop.
 
         :param func_to_call: function to be called.
+        :param timeout: optional, max number of seconds
+        that the reading should be limited to.
+        """
+        self.read(timeout, lambda _completed: func_to_call())
+
+    def cancel(self):
         """
-        def worker():
-            self.read(timeout)
-            self.process.wait()
-            func_to_call()
-            
-        thread = threading.Thread(target=worker, daemon=True)
-        thread.start()
+        Stop reading the text or drop it from the queue.
+        """
+        get_speech_queue().cancel(self)
+
+    def _finish(self, completed):
+        self.process = None
+        if self._callback is not None:
+            callback, self._callback = self._callback, None
+            GLib.idle_add(lambda: callback(completed) and False)
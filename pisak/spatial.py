@@ -0,0 +1,72 @@
+"""
+Spatial indexing of rectangular screen areas, for finding the widgets
+at the given coordinates without checking all of them.
+"""
+
+
+"""
+Default size of the grid cells, in pixels.
+"""
+CELL_SIZE = 64
+
+
+class GridIndex:
+    """
+    Uniform grid of rectangles. Each rectangle is registered in all the
+    cells it overlaps, so that finding a rectangle containing a point takes
+    checking just the rectangles registered in a single cell. Rectangles
+    are matched in the order they have been inserted.
+
+    :param cell_size: size of the grid cells, in pixels.
+    """
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        # grid cells, (column, row): list of (x, y, right, bottom, item).
+        self._cells = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def insert(self, item, x, y, width, height):
+        """
+        Insert a rectangle.
+
+        :param item: object that should be found in the rectangle.
+        :param x: x coordinate of the top left corner.
+        :param y: y coordinate of the top left corner.
+        :param width: width of the rectangle.
+        :param height: height of the rectangle.
+        """
+        right, bottom = x + width, y + height
+        entry = (x, y, right, bottom, item)
+        size = self.cell_size
+        for column in range(int(x // size), int(right // size) + 1):
+            for row in range(int(y // size), int(bottom // size) + 1):
+                self._cells.setdefault((column, row), []).append(entry)
+        self._count += 1
+
+    def find(self, x, y):
+        """
+        Find an item whose rectangle contains the given point, edges
+        included. If there are many of them, the first inserted one wins.
+
+        :param x: x coordinate of the point.
+        :param y: y coordinate of the point.
+
+        :return: item or None.
+        """
+        size = self.cell_size
+        for left, top, right, bottom, item in self._cells.get(
+                (int(x // size), int(y // size)), ()):
+            if left <= x <= right and top <= y <= bottom:
+                return item
+        return None
+
+    def clear(self):
+        """
+        Remove all the rectangles.
+        """
+        self._cells.clear()
+        self._count = 0
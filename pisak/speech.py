@@ -0,0 +1,233 @@
+"""
+Speech synthesis of the labels read out during scanning. Speech of each
+text is rendered once, by a renderer process started for the text from
+a background thread, and stored on disk as WAV files named after the hash
+of the text, the voice and the speech rate. Rendered speech is then played
+by the sound effects player, from memory, so that reading out starts as
+soon as an element is highlighted. Texts that have not been prerendered
+are read out only after their rendering is over.
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+from collections import deque
+
+from gi.repository import Clutter
+
+import pisak
+from pisak import logger, dirs, sound_effects
+
+
+_LOG = logger.get_logger(__name__)
+
+
+"""
+Commands rendering the text from a file to a WAV file, for each voice.
+"""
+RENDER_COMMANDS = {
+    "milena": ["milena_save_file", "{input}", "{output}"]
+}
+
+"""
+Default voice.
+"""
+VOICE = "milena"
+
+"""
+Default speech rate, relative to the natural one.
+"""
+RATE = 1.0
+
+"""
+Channel of the utterances read out by the `sound_effects.Synthesizer`
+when there is no renderer. Each text cancels just the previous ones from
+this channel, other utterances, i.e. messages of the symboler, go on.
+"""
+SYNTH_CHANNEL = "scanning"
+
+"""
+Max number of seconds that a text can wait to be read out by the
+`sound_effects.Synthesizer`, afterwards the scanning has moved on.
+"""
+SYNTH_STALE_AFTER = 1.0
+
+
+_SERVICE_STORE = {}
+
+
+class SpeechService:
+    """
+    Supplier of the rendered speech. Texts are rendered in order, but
+    those that are about to be read out go before the ones being
+    prerendered. If there is no renderer for the voice, texts are read out
+    by the `sound_effects.Synthesizer` directly.
+
+    :param cache_dir: directory where the rendered speech is stored.
+    :param voice: name of the voice, one of `RENDER_COMMANDS`.
+    :param rate: speech rate, relative to the natural one.
+    """
+
+    def __init__(self, cache_dir=dirs.HOME_SPEECH_DIR, voice=VOICE, rate=RATE):
+        self.cache_dir = cache_dir
+        self.voice = voice
+        self.rate = rate
+        command = RENDER_COMMANDS.get(voice)
+        self._command = command if command and shutil.which(command[0]) \
+            else None
+        if self._command is None:
+            _LOG.warning("No speech renderer for voice: {}.".format(voice))
+        self._player = None
+        self._queue = deque()
+        self._pending = set()
+        self._condition = threading.Condition()
+        # text that should be read out as soon as it is rendered:
+        self._wanted = None
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    def get_path(self, text):
+        """
+        Get path to the file with the rendered speech.
+
+        :param text: text to be read.
+
+        :return: path to the WAV file, it may not exist yet.
+        """
+        key = "{}\0{}\0{}".format(self.voice, self.rate, text)
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".wav"
+        return os.path.join(self.cache_dir, name[:2], name)
+
+    def say(self, text, max_duration=None):
+        """
+        Read the text out loud. If the speech has not been rendered yet,
+        it is rendered first, before any other texts.
+
+        :param text: text to be read.
+        :param max_duration: optional, max number of seconds
+        that the reading should be limited to.
+        """
+        if not text.strip():
+            return
+        if self._command is None:
+            self._synthesize(text, max_duration)
+            return
+        path = self.get_path(text)
+        if os.path.isfile(path):
+            self._wanted = None
+            self._play(path, max_duration)
+        else:
+            self._wanted = (text, max_duration)
+            self._enqueue([text], urgent=True)
+
+    def prerender(self, texts):
+        """
+        Render speech for the texts that have not been rendered yet,
+        in the background.
+
+        :param texts: iterable of texts.
+        """
+        if self._command is not None:
+            self._enqueue([text for text in texts if text.strip() and
+                           not os.path.isfile(self.get_path(text))])
+
+    def _enqueue(self, texts, urgent=False):
+        with self._condition:
+            for text in texts:
+                if text in self._pending:
+                    # text being rendered right now is not in the queue
+                    # any more, it is read out as soon as it is rendered:
+                    if not urgent or text not in self._queue:
+                        continue
+                    self._queue.remove(text)
+                self._pending.add(text)
+                if urgent:
+                    self._queue.appendleft(text)
+                else:
+                    self._queue.append(text)
+            self._condition.notify()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                text = self._queue.popleft()
+            try:
+                self._render(text)
+            except (OSError, subprocess.CalledProcessError) as exc:
+                _LOG.warning("Could not render speech: {}.".format(exc))
+            with self._condition:
+                self._pending.discard(text)
+            Clutter.threads_add_idle(0, self._on_rendered, text)
+
+    def _render(self, text):
+        path = self.get_path(text)
+        if os.path.isfile(path):
+            return
+        dirs.ensure_dir(os.path.dirname(path))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_path = os.path.join(temp_dir, "text.txt")
+            output_path = os.path.join(temp_dir, "speech.wav")
+            with open(input_path, "w", encoding="utf-8") as text_file:
+                text_file.write(text)
+            subprocess.check_call(
+                [arg.format(input=input_path, output=output_path)
+                 for arg in self._command],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if self.rate != 1:
+                tempo_path = os.path.join(temp_dir, "tempo.wav")
+                subprocess.check_call(
+                    ["sox", output_path, tempo_path, "tempo", str(self.rate)],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                output_path = tempo_path
+            # files are moved, not written, to the cache,
+            # so that a half-rendered speech is never played.
+            shutil.move(output_path, path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    def _on_rendered(self, text):
+        if self._wanted is not None and self._wanted[0] == text:
+            _text, max_duration = self._wanted
+            self._wanted = None
+            path = self.get_path(text)
+            if os.path.isfile(path):
+                self._play(path, max_duration)
+            else:
+                self._synthesize(text, max_duration)
+        return False
+
+    @staticmethod
+    def _synthesize(text, max_duration):
+        sound_effects.Synthesizer(
+            text, sound_effects.CANCEL_PREVIOUS,
+            stale_after=SYNTH_STALE_AFTER,
+            channel=SYNTH_CHANNEL).read(max_duration)
+
+    def _play(self, path, max_duration):
+        player = pisak.app.sound_effects_player if pisak.app else None
+        if player is None:
+            if self._player is None:
+                self._player = sound_effects.SoundEffectsPlayer({})
+            player = self._player
+        player.play(path, max_duration)
+
+
+def get_service():
+    """
+    Retrieve the speech service, configured with the voice and the speech
+    rate from the main config. Service is created just once and then
+    is stored as a module-level variable.
+
+    :return: speech service.
+    """
+    voice = pisak.config.get("speech_voice", VOICE)
+    rate = float(pisak.config.get("speech_rate", RATE))
+    try:
+        service = _SERVICE_STORE[(voice, rate)]
+    except KeyError:
+        service = SpeechService(voice=voice, rate=rate)
+        _SERVICE_STORE[(voice, rate)] = service
+    return service
@@ -1,11 +1,10 @@
 """
 Signal handlers specific for the symboler application.
 """
-import subprocess
 import configobj
 
 import pisak
-from pisak import signals, dirs
+from pisak import signals, dirs, sound_effects
 
 
 @signals.registered_handler("symboler/load_main")
@@ -99,7 +98,7 @@ def text_to_speech(entry):
     """
     text = entry.get_text()
     if text:
-        subprocess.Popen(["milena_say", text])
+        sound_effects.Synthesizer(text).read()
 
 
 @signals.registered_handler("symboler/backspace")
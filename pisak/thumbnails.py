@@ -0,0 +1,174 @@
+"""
+Thumbnail cache for photo previews. Previews are downscaled once, in a
+pool of worker threads, and stored on disk according to the freedesktop.org
+thumbnail specification, that is as PNG files named after the MD5 hash of
+the original file URI and tagged with its modification time. Decoded
+pixel buffers are then handed back on the main loop.
+"""
+import os
+import math
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from gi.repository import GLib, GdkPixbuf, Clutter
+
+from pisak import logger, dirs
+
+
+_LOG = logger.get_logger(__name__)
+
+
+"""
+Number of worker threads generating the thumbnails.
+"""
+WORKERS_COUNT = 4
+
+"""
+Thumbnail sizes are rounded up to a multiple of this value,
+so that tiles of slightly different sizes can share the same thumbnail.
+"""
+SIZE_STEP = 64
+
+
+_SERVICE_STORE = {}
+
+
+class ThumbnailService:
+    """
+    Supplier of thumbnails for image files. Each thumbnail covers the
+    requested area, so that it can be either fitted or cropped to it.
+    Simultaneous requests for the same thumbnail are served by a single job.
+
+    :param cache_dir: directory where the thumbnails are stored.
+    """
+
+    def __init__(self, cache_dir=dirs.HOME_THUMBNAILS_DIR):
+        self.cache_dir = cache_dir
+        self._executor = ThreadPoolExecutor(max_workers=WORKERS_COUNT)
+        self._lock = threading.Lock()
+        # callbacks waiting for the thumbnails that are being generated.
+        self._pending = {}
+
+    def request(self, path, width, height, callback):
+        """
+        Request a thumbnail of the given image. Callback is called on
+        the main loop with the image path and the decoded `GdkPixbuf.Pixbuf`
+        instance or None if the thumbnail could not be obtained.
+
+        :param path: path to the original image.
+        :param width: minimum width of the thumbnail.
+        :param height: minimum height of the thumbnail.
+        :param callback: function to be called when the thumbnail is ready.
+        """
+        size = self._round_size(width), self._round_size(height)
+        key = (path, size)
+        with self._lock:
+            if key in self._pending:
+                self._pending[key].append(callback)
+                return
+            self._pending[key] = [callback]
+        self._executor.submit(self._work, key)
+
+    def get_thumbnail(self, path, width, height):
+        """
+        Get a thumbnail of the given image, load it from the disk cache
+        or generate it if there is none or if it is outdated.
+        Blocks until the thumbnail is ready.
+
+        :param path: path to the original image.
+        :param width: minimum width of the thumbnail.
+        :param height: minimum height of the thumbnail.
+
+        :return: `GdkPixbuf.Pixbuf` instance.
+        """
+        size = self._round_size(width), self._round_size(height)
+        mtime = str(int(os.path.getmtime(path)))
+        thumb_path = self._get_thumbnail_path(path, size)
+        if os.path.isfile(thumb_path):
+            try:
+                pixbuf = GdkPixbuf.Pixbuf.new_from_file(thumb_path)
+                if pixbuf.get_option('tEXt::Thumb::MTime') == mtime:
+                    return pixbuf
+            except GLib.GError as exc:
+                _LOG.warning(exc)
+        pixbuf = self._scale(path, size)
+        self._save(pixbuf, thumb_path, path, mtime)
+        return pixbuf
+
+    def shutdown(self):
+        """
+        Stop the workers, any pending requests are abandoned.
+        """
+        self._executor.shutdown(wait=False)
+
+    def _work(self, key):
+        path, size = key
+        try:
+            pixbuf = self.get_thumbnail(path, *size)
+        except (OSError, GLib.GError) as exc:
+            _LOG.error(exc)
+            pixbuf = None
+        with self._lock:
+            callbacks = self._pending.pop(key, [])
+        Clutter.threads_add_idle(0, self._deliver, (path, pixbuf, callbacks))
+
+    @staticmethod
+    def _deliver(data):
+        path, pixbuf, callbacks = data
+        for callback in callbacks:
+            callback(path, pixbuf)
+        return False
+
+    @staticmethod
+    def _round_size(value):
+        return max(SIZE_STEP, int(math.ceil(value / SIZE_STEP)) * SIZE_STEP)
+
+    def _get_thumbnail_path(self, path, size):
+        uri = GLib.filename_to_uri(os.path.abspath(path), None)
+        name = hashlib.md5(uri.encode('utf-8')).hexdigest() + '.png'
+        return os.path.join(self.cache_dir, '{}x{}'.format(*size), name)
+
+    @staticmethod
+    def _scale(path, size):
+        """
+        Decode the image already scaled down, so that it covers the
+        given size, keeping the aspect ratio. Images are never upscaled.
+        """
+        _format, orig_width, orig_height = GdkPixbuf.Pixbuf.get_file_info(path)
+        if not orig_width or not orig_height:
+            return GdkPixbuf.Pixbuf.new_from_file(path)
+        scale = min(1, max(size[0] / orig_width, size[1] / orig_height))
+        return GdkPixbuf.Pixbuf.new_from_file_at_scale(
+            path, max(1, int(orig_width * scale)),
+            max(1, int(orig_height * scale)), True)
+
+    @staticmethod
+    def _save(pixbuf, thumb_path, path, mtime):
+        uri = GLib.filename_to_uri(os.path.abspath(path), None)
+        dirs.ensure_dir(os.path.dirname(thumb_path))
+        # write to a temporary file first, so that no other worker or
+        # process ever reads a half-written thumbnail.
+        temp_path = '{}.{}.tmp'.format(thumb_path, threading.get_ident())
+        try:
+            pixbuf.savev(temp_path, 'png',
+                         ['tEXt::Thumb::URI', 'tEXt::Thumb::MTime'],
+                         [uri, mtime])
+            os.replace(temp_path, thumb_path)
+        except (OSError, GLib.GError) as exc:
+            _LOG.warning(exc)
+
+
+def get_service():
+    """
+    Retrieve the thumbnail service. Service is created just once and then
+    is stored as a module-level variable.
+
+    :return: thumbnail service.
+    """
+    try:
+        service = _SERVICE_STORE[dirs.HOME_THUMBNAILS_DIR]
+    except KeyError:
+        service = ThumbnailService()
+        _SERVICE_STORE[dirs.HOME_THUMBNAILS_DIR] = service
+    return service
@@ -1,6 +1,9 @@
 """
 Websocket server and client implementations for PISAK eyetrackers.
 """
+import os
+import time
+import fcntl
 import asyncio
 import threading
 
@@ -9,6 +12,7 @@ from ws4py.server.tulipserver import WebSocketProtocol
 from ws4py.client.threadedclient import WebSocketClient
 
 from pisak import logger
+from pisak.gaze_trace import TraceWriter, pack_samples, unpack_samples
 
 
 _LOG = logger.get_logger('tracker')
@@ -17,12 +21,40 @@ SERVER_HOST = '127.0.0.1'
 SERVER_PORT = '28394'
 
 CLIENT_START_MSG = 'start'
+CLIENT_START_BINARY_MSG = 'start-binary'
 CLIENT_STOP_MSG = 'stop'
 
+"""
+Default maximum number of samples sent in a single binary frame.
+"""
+BATCH_SIZE = 1
+
+"""
+Prefix of the tracker output lines with the gaze position.
+"""
+GAZE_POS_PREFIX = b'gaze_pos:'
+
+"""
+Maximum interval between the timestamps of two consecutive samples read
+in a single go, in seconds. Such samples are spread evenly over the time
+since the previous read, but after a pause of the tracker they are not
+spread back beyond this limit.
+"""
+MAX_SAMPLE_INTERVAL = 0.05
+
 
 class TrackerServer:
     """
-    Server for trackers.
+    Server for trackers. All the output of the tracker available at once
+    is read in a single go and the samples are sent to the clients either
+    as text messages, one per sample, or as binary frames, up to
+    `batch_size` samples each, if the clients have asked so. Samples can
+    be recorded to a trace file, see :mod:`pisak.gaze_trace`.
+
+    :param tracker: tracker process.
+    :param batch_size: maximum number of samples in a single binary frame.
+    :param record_path: path to the trace file the samples should be
+    recorded to or None.
     """
 
     clients = set()
@@ -35,6 +67,7 @@ class TrackerServer:
         def __init__(self, *args, **kwargs):
             WebSocket.__init__(self, *args, **kwargs)
             self.active = False
+            self.binary = False
 
         def received_message(self, message):
             """
@@ -45,8 +78,9 @@ class TrackerServer:
             `BinaryMessage`instance.
             """
             msg = str(message)
-            if msg == CLIENT_START_MSG:
+            if msg in (CLIENT_START_MSG, CLIENT_START_BINARY_MSG):
                 self.active = True
+                self.binary = msg == CLIENT_START_BINARY_MSG
             elif msg == CLIENT_STOP_MSG:
                 self.active = False
 
@@ -75,8 +109,15 @@ class TrackerServer:
             except KeyError:
                 _LOG.warning("Client {} had not been registered.".format(self))
 
-    def __init__(self, tracker):
+    def __init__(self, tracker, batch_size=BATCH_SIZE, record_path=None):
         self._tracker = tracker
+        self.batch_size = max(1, batch_size)
+        self._recorder = TraceWriter(record_path) \
+            if record_path is not None else None
+        # incomplete line read from the tracker:
+        self._pending_output = b''
+        # timestamp of the last sample read from the tracker:
+        self._last_timestamp = 0.0
         self._server = None
         self._loop = asyncio.get_event_loop()
         self._worker = threading.Thread(target=self._start_server, daemon=True)
@@ -100,23 +141,92 @@ class TrackerServer:
         """
         asyncio.set_event_loop(self._loop)
         self._server = self._loop.run_until_complete(self._create_server())
-        self._loop.add_reader(self._tracker.stdout, self._read_from_tracker)
+        fd = self._tracker.stdout.fileno()
+        fcntl.fcntl(fd, fcntl.F_SETFL,
+                    fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self._loop.add_reader(fd, self._read_from_tracker)
         self._loop.run_forever()
 
+    def _drain_tracker(self):
+        """
+        Read all the output of the tracker that is available right now.
+
+        :return: list of complete lines and whether the output has ended.
+        """
+        fd = self._tracker.stdout.fileno()
+        chunks = [self._pending_output]
+        ended = False
+        while True:
+            try:
+                chunk = os.read(fd, 65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                ended = True
+                break
+            chunks.append(chunk)
+        lines = b''.join(chunks).split(b'\n')
+        self._pending_output = lines.pop()
+        return lines, ended
+
     def _read_from_tracker(self):
         """
         Read form the tracker standard output and send data to all the
         active clients.
         """
-        data = self._tracker.stdout.readline()
-        if not data:
-            return
-        data = data.decode('utf-8', 'ignore').strip()
-        if 'gaze_pos:' in data:
-            data_to_send = data.replace('gaze_pos:', '').strip()
-            for client in self.clients:
-                if client.active:
-                    client.send(data_to_send)
+        lines, ended = self._drain_tracker()
+        if ended:
+            self._loop.remove_reader(self._tracker.stdout.fileno())
+        positions = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith(GAZE_POS_PREFIX):
+                try:
+                    x, y = line[len(GAZE_POS_PREFIX):].split()
+                    positions.append((float(x), float(y)))
+                except ValueError:
+                    _LOG.warning("Invalid tracker output: {}.".format(line))
+        if positions:
+            samples = self._stamp(positions)
+            if self._recorder is not None:
+                self._recorder.write(samples)
+            self._send(samples)
+
+    def _stamp(self, positions):
+        """
+        Give timestamps to the positions read in a single go, spread
+        evenly up to the current time, so that each sample has a distinct
+        timestamp and the intervals between them are not zero.
+
+        :param positions: list of (x, y) tuples.
+
+        :return: list of (timestamp, x, y) tuples.
+        """
+        now = time.monotonic()
+        count = len(positions)
+        start = max(self._last_timestamp, now - count * MAX_SAMPLE_INTERVAL)
+        step = (now - start) / count
+        self._last_timestamp = now
+        return [(start + (idx + 1) * step, x, y)
+                for idx, (x, y) in enumerate(positions)]
+
+    def _send(self, samples):
+        frames = texts = None
+        for client in self.clients:
+            if not client.active:
+                continue
+            if client.binary:
+                if frames is None:
+                    frames = [pack_samples(samples[idx:idx + self.batch_size])
+                              for idx in range(0, len(samples),
+                                               self.batch_size)]
+                for frame in frames:
+                    client.send(frame, binary=True)
+            else:
+                if texts is None:
+                    texts = ['{} {}'.format(x, y) for _t, x, y in samples]
+                for text in texts:
+                    client.send(text)
 
     def run(self):
         """
@@ -132,6 +242,8 @@ class TrackerServer:
         self._server.wait_closed()
         self._loop.stop()
         self._worker.join()
+        if self._recorder is not None:
+            self._recorder.close()
 
 
 class TrackerClient(WebSocketClient):
@@ -150,9 +262,9 @@ class TrackerClient(WebSocketClient):
     def activate(self):
         """
         Activate the client. Activated client will be able to receive data from
-         the tracker server.
+         the tracker server, in binary frames.
         """
-        self.send(CLIENT_START_MSG)
+        self.send(CLIENT_START_BINARY_MSG)
 
     def deactivate(self):
         """
@@ -169,7 +281,10 @@ class TrackerClient(WebSocketClient):
 
         :param data: received binary data item.
         """
-        self.target.on_new_data(str(data))
+        if data.is_binary:
+            self.target.on_new_samples(unpack_samples(data.data))
+        else:
+            self.target.on_new_data(str(data))
 
 if __name__ == '__main__':
     import os
@@ -192,6 +307,9 @@ if __name__ == '__main__':
         def on_new_data(self, data):
             print('on_new_data: {}'.format(data))
 
+        def on_new_samples(self, samples):
+            print('on_new_samples: {}'.format(samples))
+
     client_mockup = ClientMockup()
 
     tracker_client = TrackerClient(client_mockup)
@@ -19,6 +19,9 @@ FAVOURITE_PHOTOS_STORE = os.path.join(dirs.HOME_PISAK_FAVOURITES, "favourite_pho
 FAVOURITE_PHOTOS_ALIAS = "ULUBIONE"
 
 
+LIBRARY_INDEX = os.path.join(dirs.HOME_PISAK_DATABASES, "photo_library.db")
+
+
 _LIBRARY_STORE = {}
 
 
@@ -33,7 +36,8 @@ def get_library():
         library = _LIBRARY_STORE[LIBRARY_DIR]
     except KeyError:
         library = media_library.Library(LIBRARY_DIR, ACCEPTED_TYPES, FAVOURITE_PHOTOS_STORE,
-                          FAVOURITE_PHOTOS_ALIAS)
+                          FAVOURITE_PHOTOS_ALIAS, index_path=LIBRARY_INDEX)
         library.include_favs()
+        library.watch()
         _LIBRARY_STORE[LIBRARY_DIR] = library
     return library
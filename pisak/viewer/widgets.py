@@ -370,6 +370,11 @@ class LibraryTilesSource(pager.DataSource):
 
     def __init__(self):
         super().__init__()
+        library = model.get_library()
+        self.data = list(library.get_all_categories())
+        library.on_change.add(self._on_library_change)
+
+    def _on_library_change(self):
         self.data = list(model.get_library().get_all_categories())
 
     def _produce_item(self, album):
@@ -381,7 +386,7 @@ class LibraryTilesSource(pager.DataSource):
         tile.hilite_tool = widgets.Aperture()
         preview_path = album.get_preview_path()
         if preview_path:
-            tile.preview_path = preview_path
+            tile.load_preview(preview_path)
         return tile
 
 
@@ -399,6 +404,12 @@ class AlbumTilesSource(pager.DataSource):
         self.data_generator = lambda value: \
                         self.library.get_category_by_id(value).get_all_items()
         self.data_sets_count = len(self.library.get_all_categories())
+        self.library.on_change.add(self._on_library_change)
+
+    def _on_library_change(self):
+        self.data_sets_count = len(self.library.get_all_categories())
+        if self.data_set_idx is not None:
+            self.data_set_idx = self.data_set_idx
 
     def _produce_item(self, data_item):
         tile = widgets.PhotoTile()
@@ -407,7 +418,7 @@ class AlbumTilesSource(pager.DataSource):
         tile.connect("clicked", self.item_handler,
                         data_item.id, self.data_set_idx)
         tile.scale_mode = Mx.ImageScaleMode.FIT
-        tile.preview_path = data_item.path
+        tile.load_preview(data_item.path)
         return tile
 
 
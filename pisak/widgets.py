@@ -12,7 +12,7 @@ from gi.repository import Clutter, Mx, GObject, Cogl, GdkPixbuf, Pango
 
 import pisak
 from pisak import res, logger, unit, properties, scanning, configurator, \
-    utils, media, style, layout, svg, sound_effects, dirs
+    utils, media, style, layout, svg, sound_effects, dirs, thumbnails
 from pisak.res import colors
 
 
@@ -115,7 +115,9 @@ class Playlist(Mx.ScrollView, properties.PropertyAdapter,
                configurator.Configurable):
     """
     Widget displaying scrollable list of buttons, each representing
-    one media item.
+    one media item. Item that will be played next is planned ahead and
+    handed to the playback, together with the previous one, so that
+    the transitions are gapless and moving between the items is instant.
     """
     __gtype_name__ = "PisakPlaylist"
     __gproperties__ = {
@@ -147,8 +149,9 @@ class Playlist(Mx.ScrollView, properties.PropertyAdapter,
         self.visual = None
         self.items = []
         self.idx = 0
-        self.random_order = False
-        self.looped = False
+        self._next_idx = None
+        self._random_order = False
+        self._looped = False
         self.apply_props()
         self._create_box()
 
@@ -176,6 +179,30 @@ class Playlist(Mx.ScrollView, properties.PropertyAdapter,
         self._ratio_height = value
         self.set_height(unit.h(value))
 
+    @property
+    def random_order(self):
+        """
+        Whether items should be played in a random order.
+        """
+        return self._random_order
+
+    @random_order.setter
+    def random_order(self, value):
+        self._random_order = value
+        self._prepare_next()
+
+    @property
+    def looped(self):
+        """
+        Whether playing should start over after the last item.
+        """
+        return self._looped
+
+    @looped.setter
+    def looped(self, value):
+        self._looped = value
+        self._prepare_next()
+
     @property
     def playback(self):
         """
@@ -188,8 +215,11 @@ class Playlist(Mx.ScrollView, properties.PropertyAdapter,
         self._playback = value
         if value is not None:
             value.connect("eos", lambda *_: self._next())
+            value.connect("track-changed",
+                          lambda _source, path: self._on_track_changed(path))
             if len(self.items) > 0:
                 value.filename = self.items[0].path
+                self._prepare_next()
 
     @property
     def info_display(self):
@@ -235,7 +265,8 @@ class Playlist(Mx.ScrollView, properties.PropertyAdapter,
         self.add_actor(self.box)
 
     def _generate_content(self):
-        self._clean_old()
+        playing_path = self._get_playing_path()
+        self._clean_old(keep_playing=playing_path is not None)
         self.items = self.data_source.get_all_items()
         for pos, item in enumerate(self.items):
             if pos == len(self.items) - 1:
@@ -245,13 +276,28 @@ class Playlist(Mx.ScrollView, properties.PropertyAdapter,
             self.box.add_actor(item, pos)
             item.connect("clicked", lambda src, item:
             self._play_item(item), item)
-        if len(self.items) > 0:
-            self.move_focus()
+        paths = [getattr(item, "path", None) for item in self.items]
+        if playing_path is not None and playing_path in paths:
+            # the item being played is still there, playback goes on:
+            self.idx = paths.index(playing_path)
+            self.move_focus(and_play=False)
+        else:
+            if playing_path is not None:
+                self.playback.stop()
+            if len(self.items) > 0:
+                self.move_focus()
+
+    def _get_playing_path(self):
+        if self.playback is not None and self.idx < len(self.items) and \
+                self.is_playing():
+            return getattr(self.items[self.idx], "path", None)
+        return None
 
-    def _clean_old(self):
-        if self.is_playing():
+    def _clean_old(self, keep_playing=False):
+        if not keep_playing and self.is_playing():
             self.stop()
         self.idx = 0
+        self._next_idx = None
         self.box.unparent()
         self.box.destroy()
         self._create_box()
@@ -275,22 +321,56 @@ class Playlist(Mx.ScrollView, properties.PropertyAdapter,
                     return
             self.info_display.set_text("")
 
-    def _next(self):
-        self.playback.stop()
-        self.items[self.idx].untoggle()
+    def _plan_next(self):
+        if len(self.items) < 2:
+            return None
         if self.random_order is True:
             avalaible = list(range(len(self.items)))
             avalaible.remove(self.idx)
-            self.idx = random.choice(avalaible)
-            self.move_focus(self.items[self.idx],
-                            Mx.FocusDirection.NEXT, and_play=True)
+            return random.choice(avalaible)
+        idx = (self.idx + 1) % len(self.items)
+        if idx == 0 and self.looped is False:
+            return None
+        return idx
+
+    def _prepare_next(self):
+        """
+        Plan the item that will be played next and let the playback
+        load it ahead of time, together with the previous item.
+        """
+        if self.playback is None or len(self.items) == 0:
+            return
+        self._next_idx = self._plan_next()
+        next_path = self.items[self._next_idx].path \
+            if self._next_idx is not None else None
+        self.playback.set_next(next_path)
+        previous_path = self.items[(self.idx - 1) % len(self.items)].path
+        self.playback.preload([next_path, previous_path])
+
+    def _on_track_changed(self, path):
+        # next item has been started gaplessly by the playback itself.
+        if self._next_idx is not None and \
+                self.items[self._next_idx].path == path:
+            idx = self._next_idx
         else:
-            self.idx = (self.idx + 1) % len(self.items)
-            if self.idx == 0 and self.looped is False:
-                self.stop()
-            else:
-                self.move_focus(self.items[self.idx],
-                                Mx.FocusDirection.NEXT, and_play=True)
+            paths = [item.path for item in self.items]
+            if path not in paths:
+                return
+            idx = paths.index(path)
+        previous = self.items[self.idx]
+        previous.untoggle()
+        self.idx = idx
+        self.move_focus(previous, Mx.FocusDirection.NEXT, and_play=False)
+
+    def _next(self):
+        self.playback.stop()
+        self.items[self.idx].untoggle()
+        if self._next_idx is None:
+            self.stop()
+        else:
+            previous = self.items[self.idx]
+            self.idx = self._next_idx
+            self.move_focus(previous, Mx.FocusDirection.NEXT, and_play=True)
 
     def _play_item(self, item):
         self.items[self.idx].untoggle()
@@ -312,6 +392,7 @@ class Playlist(Mx.ScrollView, properties.PropertyAdapter,
         if len(self.items) > 1:
             self.items[1].move_focus(Mx.FocusDirection.PREVIOUS,
                                      self.items[self.idx])
+        self._prepare_next()
 
     def pause(self):
         """
@@ -361,6 +442,7 @@ class Playlist(Mx.ScrollView, properties.PropertyAdapter,
                 self.playback.filename = self.items[self.idx].path
             if and_play:
                 self.play()
+            self._prepare_next()
 
     def move_next(self):
         """
@@ -1128,17 +1210,49 @@ class PhotoTile(layout.Bin, properties.PropertyAdapter, scanning.Scannable,
     @preview_path.setter
     def preview_path(self, value):
         self._preview_path = value
+        width, height = self._get_preview_size()
+        try:
+            self.preview.set_from_file_at_size(value, width, height)
+        except GObject.GError as exc:
+            _LOG.error(exc)
+            self.preview.clear()
+
+    def load_preview(self, path):
+        """
+        Load the preview photo in the background, through the
+        thumbnail cache. Should be used instead of setting the
+        `preview_path` for big, full-resolution photos.
+
+        :param path: path to the preview photo.
+        """
+        self._preview_path = path
+        if not path:
+            self.preview.clear()
+            return
+        width, height = self._get_preview_size()
+        thumbnails.get_service().request(path, width, height,
+                                         self._on_preview_loaded)
+
+    def _on_preview_loaded(self, path, pixbuf):
+        if path != self._preview_path:
+            return  # preview has been changed in the meantime
+        if pixbuf is None:
+            self.preview.clear()
+            return
+        self.preview.set_from_data(
+            pixbuf.get_pixels(),
+            Cogl.PixelFormat.RGBA_8888 if pixbuf.get_has_alpha() else
+            Cogl.PixelFormat.RGB_888,
+            pixbuf.get_width(), pixbuf.get_height(), pixbuf.get_rowstride())
+
+    def _get_preview_size(self):
         width, height = self.preview.get_size()
         if width <= 1 or height <= 1:  # 1 x 1 as unrenderable picture size
             width, height = self.get_size()
         if width <= 1 or height <= 1:
             width = self.preview_loading_width
             height = self.preview_loading_height
-        try:
-            self.preview.set_from_file_at_size(value, width, height)
-        except GObject.GError as exc:
-            _LOG.error(exc)
-            self.preview.clear()
+        return width, height
 
     @property
     def preview_ratio_width(self):
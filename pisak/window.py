@@ -5,8 +5,9 @@ import os
 
 from gi.repository import Clutter, Mx
 
+import pisak
 from pisak import exceptions
-from pisak import signals, configurator, dirs, inputs, widgets
+from pisak import signals, configurator, dirs, inputs, widgets, speech
 
 import pisak.layout  # @UnusedImport
 import pisak.handlers  # @UnusedImport
@@ -186,6 +187,36 @@ class Window(configurator.Configurable):
             self.stage.add_child(main_actor)
         self.input_group.load_content(main_actor)
         self.script = script
+        if pisak.config.as_bool("sound_effects_enabled") and \
+                pisak.config.as_bool("sound_support_enabled") and \
+                pisak.config.as_bool("speech_synthesis"):
+            speech.get_service().prerender(self._collect_spoken_labels(
+                main_actor))
+
+    @staticmethod
+    def _collect_spoken_labels(actor):
+        """
+        Collect labels of all the elements of the view that will be
+        read out when scanned.
+
+        :param actor: top-level actor of the view.
+
+        :return: list of labels.
+        """
+        labels = []
+        actors = [actor]
+        while actors:
+            current = actors.pop()
+            if isinstance(current, widgets.Button):
+                label = current.get_label()
+                if label and label.strip() and not current.sound and \
+                        label not in current.sounds:
+                    labels.append(label)
+            elif isinstance(current, widgets.PhotoTile):
+                if current.label_text:
+                    labels.append(current.label_text)
+            actors.extend(current.get_children())
+        return labels
 
     def load_popup(self, message, unwind=None, unwind_data=None,
                    container=None, timeout=5000, icon=True):
@@ -34,6 +34,7 @@ setup(
     scripts = ['bin/pisak', 'bin/pisak-audio', 'bin/pisak-blog',
                'bin/pisak-email', 'bin/pisak-movie', 'bin/pisak-paint',
                'bin/pisak-speller', 'bin/pisak-symboler', 'bin/pisak-viewer'],
+    python_requires = '>=3.5',
     zip_safe = False,
     include_package_data = True,
     install_requires = ['pressagio', 'pydenticon', 'ezodf',